@@ -1,7 +1,17 @@
 import os
+import re
+import csv
+import codecs
 import json
 import io
-from flask import Flask, request, jsonify, render_template_string
+import mmap
+import heapq
+import tempfile
+from array import array
+from contextlib import contextmanager
+from itertools import repeat
+import numpy as np
+from flask import Flask, Request, request, jsonify, render_template_string
 from flask_compress import Compress
 from google import genai
 from google.genai import types
@@ -27,9 +37,78 @@ except Exception as e:
     # إذا حدث خطأ، نتأكد من أن المفتاح سيبقى 'FAKE_KEY' لكي يتم الفحص لاحقًا
     pass
 
+# =========================================================================
+# حدود رفع الملفات (قابلة للضبط عبر متغيرات البيئة)
+# MAX_UPLOAD_MB: الحد الأقصى الصارم لحجم الطلب، ويُرفض الطلب مبكراً بناءً على Content-Length.
+# UPLOAD_SPOOL_THRESHOLD_KB: الملفات الأكبر من هذا الحد تُكتب مباشرة إلى ملف مؤقت على القرص بدلاً من الذاكرة.
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', '50')) * 1024 * 1024
+SPOOL_THRESHOLD_BYTES = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD_KB', '512')) * 1024
+
+
+class SpoolingRequest(Request):
+    """طلب Flask يكتب الملفات المرفوعة الكبيرة إلى القرص مباشرة للحفاظ على ذاكرة ثابتة لكل طلب."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # الطلبات مجهولة الطول أو الكبيرة تذهب إلى ملف مؤقت يُحذف تلقائياً عند إغلاق الطلب
+        if total_content_length is None or total_content_length > SPOOL_THRESHOLD_BYTES:
+            return tempfile.TemporaryFile('wb+')
+        return io.BytesIO()
+
+
+def _release_buffer(*buffers):
+    """تحرير المخزن بعد الانتهاء منه. إن بقيت مصفوفة NumPy تشير إليه (مثلاً في إطار استثناء)
+    يُترك تحريره لجامع القمامة بدلاً من إخفاء الاستثناء الأصلي بخطأ BufferError."""
+    for buffer in buffers:
+        try:
+            if isinstance(buffer, memoryview):
+                buffer.release()
+            else:
+                buffer.close()
+        except BufferError:
+            pass
+
+
+@contextmanager
+def open_log_buffer(file_storage):
+    """فتح الملف المرفوع كـ memoryview للقراءة فقط (mmap للملفات المؤقتة) دون نسخ محتواه إلى الذاكرة."""
+    stream = file_storage.stream
+    stream.flush()
+
+    # الملفات الصغيرة موجودة أصلاً في الذاكرة: نستخدم مخزنها مباشرة
+    if isinstance(stream, io.BytesIO):
+        view = stream.getbuffer()
+        try:
+            yield view
+        finally:
+            _release_buffer(view)
+        return
+
+    stream.seek(0, os.SEEK_END)
+    if stream.tell() == 0:
+        # لا يمكن عمل mmap لملف فارغ
+        yield memoryview(b'')
+        return
+
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        # تدفق لا يدعم mmap: نرجع إلى القراءة الكاملة كحل احتياطي
+        stream.seek(0)
+        yield memoryview(stream.read())
+        return
+
+    mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        _release_buffer(view, mapped)
+
 # =========================================================================
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 Compress(app) # تهيئة ضغط Gzip
 
 # مخطط JSON المطلوب من النموذج (ضروري للحصول على استجابة منظمة)
@@ -214,7 +293,1203 @@ ANALYSIS_SCHEMA = types.Schema(
     },
     required=["risk_assessment", "attack_narrative", "tables", "detailed_findings", "recommendations", "interactive_timeline", "analysis_metadata"]
 )
+
+# ترتيب أعمدة كل جدول كما هو محدد في المخطط (يُستخدم للصيغة المضغوطة وللواجهة الأمامية)
+TABLE_COLUMNS = {
+    name: table_schema.items.property_ordering
+    for name, table_schema in ANALYSIS_SCHEMA.properties["tables"].properties.items()
+}
+
+
+def compact_tables(analysis_data):
+    """تحويل صفوف الجداول إلى مصفوفات مع قائمة أعمدة واحدة بدلاً من تكرار أسماء المفاتيح العربية في كل صف."""
+    tables = analysis_data.get("tables") or {}
+    for name, columns in TABLE_COLUMNS.items():
+        rows = tables.get(name)
+        if isinstance(rows, list):
+            tables[name] = {
+                "columns": columns,
+                "rows": [[row.get(column, "") for column in columns] for row in rows]
+            }
+    return analysis_data
+# =====================================================================
+
+
+# =====================================================================
+# الإدخال المنظم (CSV / JSON / JSONL): تمثيل عمودي مضغوط بدلاً من إرسال النص الخام
+# =====================================================================
+STRUCTURED_EXTENSIONS = ('.csv', '.json', '.jsonl')
+
+# الأعمدة غير الأمنية التي يتجاوز عدد قيمها الفريدة هذا الحد تُستبعد من الإسقاط (معرفات، User-Agent، الخ)
+STRUCTURED_DICTIONARY_LIMIT = int(os.environ.get('STRUCTURED_DICTIONARY_LIMIT', '256'))
+# الحد الأقصى للأعمدة المُتتبعة أثناء القراءة، وللأعمدة المُسقطة في الأحداث؛ الزائد يُلخص كأعمدة مستبعدة
+STRUCTURED_MAX_COLUMNS = int(os.environ.get('STRUCTURED_MAX_COLUMNS', '4096'))
+STRUCTURED_EVENT_COLUMNS = int(os.environ.get('STRUCTURED_EVENT_COLUMNS', '64'))
+STRUCTURED_LISTED_COLUMNS = 50  # عدد أسماء الأعمدة المستبعدة المذكورة بالاسم في الملخص
+STRUCTURED_DICTIONARY_CHARS = 2000  # الحد الأقصى لنص قاموس كل عمود في الملخص
+STRUCTURED_TOP_VALUES = 5
+
+LINE_PATTERN = re.compile(rb'[^\n]*\n|[^\n]+')
+JSON_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+JSON_CHUNK_BYTES = 1 << 20
+JSONL_PROBE_BYTES = 1 << 20
+# مفاتيح قوائم السجلات المعروفة في كائن JSON علوي (CloudTrail، Azure، Elasticsearch، الخ)
+JSON_RECORD_KEYS = ('Records', 'records', 'events', 'Events', 'value', 'items', 'logs', 'data', 'results', 'hits')
+IP_VALUE_PATTERN = re.compile(r'^(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?$|^\[?[0-9a-fA-F]*:[0-9a-fA-F:.]+\]?$')
+TIMESTAMP_VALUE_PATTERN = re.compile(
+    r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}'          # ISO 8601
+    r'|^\[?\d{1,2}/\w{3}/\d{4}:\d{2}:\d{2}'        # Apache/Nginx
+    r'|^\w{3} +\d{1,2} \d{2}:\d{2}:\d{2}'          # Syslog
+    r'|^\d{10}(?:\d{3})?(?:\.\d+)?$'               # Unix epoch
+)
+
+# أدوار الأعمدة ذات الصلة الأمنية بالترتيب، مع أنماط الاسم مرتبة حسب الأولوية ونوع القيم المطلوب (إن وجد)؛
+# مثلاً userIdentity.userName يتقدم على userIdentity.type الذي يطابق البادئة user فقط
+SECURITY_COLUMN_ROLES = (
+    ("timestamp", (re.compile(r'(^|_)(timestamp|time|date|datetime|ts|eventtime|time_?generated|created_?at|logged_?at)($|_)'),), TIMESTAMP_VALUE_PATTERN),
+    ("src_ip", (re.compile(r'(^|_)(src|source|client|remote|origin|c)($|_)|srcip|clientip|remoteaddr|^ip($|_)|ip_?address'),), IP_VALUE_PATTERN),
+    ("dst_ip", (re.compile(r'(^|_)(dst|dest|destination|server|target|s)($|_)|dstip|destip|serverip'),), IP_VALUE_PATTERN),
+    ("user", (
+        re.compile(r'(^|_)(user_?name|principal(_?(name|id))?|login_?name|account_?name)($|_)'),
+        re.compile(r'^(?!.*_type$)(.*(user(?!_?agent)|account|login|principal|actor)|(.*_)?uid($|_))'),
+    ), None),
+    ("action", (re.compile(r'action|operation|activity|method|verb|command|(^|_)event(_?(type|name))?$'),), None),
+    ("status", (re.compile(r'status|result|outcome|error_?code|severity|(^|_)level($|_)|response_?code|(^|_)code$'),), None),
+)
+
+
+def iter_buffer_lines(buffer):
+    """تكرار أسطر المخزن (mmap) كنصوص مع نهايات الأسطر دون نسخ الملف كاملاً إلى الذاكرة."""
+    for match in LINE_PATTERN.finditer(buffer):
+        yield match.group().decode('utf-8').lstrip('\ufeff')
+
+
+def flatten_record(record, prefix=''):
+    """تسطيح سجل JSON متداخل إلى مفاتيح منقوطة (مثل source.ip) مع تحويل القيم إلى نصوص."""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, name + '.'))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, ensure_ascii=False)
+        elif value is not None and value != '':
+            flat[name] = str(value)
+    return flat
+
+
+class _JsonStream:
+    """قارئ JSON تدريجي فوق المخزن: يفك الترميز على دفعات ويحلل قيمة واحدة في كل مرة عبر raw_decode."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.parser = json.JSONDecoder()
+        self.text = ''
+        self.pos = 0
+
+    def _fill(self):
+        """قراءة الدفعة التالية من المخزن وإضافتها إلى النص غير المستهلك."""
+        if self.offset >= len(self.buffer):
+            return False
+        chunk = self.buffer[self.offset:self.offset + JSON_CHUNK_BYTES]
+        self.offset += len(chunk)
+        self.text = self.text[self.pos:] + self.decoder.decode(chunk, self.offset >= len(self.buffer))
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """الحرف التالي بعد تخطي المسافات، أو None عند نهاية المخزن."""
+        while True:
+            self.pos = JSON_WHITESPACE_PATTERN.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON document, found {char!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        """تحليل قيمة JSON كاملة، مع قراءة دفعات إضافية إذا كانت القيمة مقطوعة عند نهاية النص الحالي."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.parser.raw_decode(self.text, self.pos)
+                # رقم في نهاية الدفعة قد يكون مقطوعاً
+                if end < len(self.text) or self.offset >= len(self.buffer):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.offset >= len(self.buffer):
+                    raise
+            self._fill()
+
+    def iter_array(self):
+        self.expect('[')
+        yield from self._iter_items()
+
+    def _iter_items(self):
+        """عناصر مصفوفة بعد قراءة قوس البداية."""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.expect(',]') == ']':
+                return
+
+    def iter_object_records(self):
+        """سجلات كائن علوي: عناصر مصفوفة بمفتاح معروف (مثل Records في CloudTrail) أو مصفوفة كائنات،
+        وإلا عناصر أول مصفوفة فيه، وإلا الكائن نفسه كسجل واحد."""
+        self.expect('{')
+        fields = {}
+        streamed = False
+        first_array = None
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                key = self.read_value()
+                self.expect(':')
+                if self.peek() == '[':
+                    self.pos += 1
+                    # قوائم السجلات تُقرأ كتدفق؛ المصفوفات الأخرى (مثل tags) تُحفظ كقيم عادية
+                    if key in JSON_RECORD_KEYS or (not streamed and self.peek() == '{'):
+                        streamed = True
+                        yield from self._iter_items()
+                    else:
+                        fields[key] = list(self._iter_items())
+                        if first_array is None:
+                            first_array = key
+                else:
+                    fields[key] = self.read_value()
+                if self.expect(',}') == '}':
+                    break
+        if not streamed:
+            if first_array is not None:
+                yield from fields[first_array]
+            else:
+                yield fields
+
+
+def _looks_like_jsonl(buffer):
+    """فحص بداية ملف .json: سطر أول هو كائن كامل يتبعه محتوى آخر يعني أن الملف JSONL فعلياً."""
+    head = bytes(buffer[:JSONL_PROBE_BYTES]).lstrip(b'\xef\xbb\xbf \t\r\n')
+    newline = head.find(b'\n')
+    if newline < 0 or not head.startswith(b'{') or not head[newline:].strip():
+        return False
+    try:
+        return isinstance(json.loads(head[:newline]), dict)
+    except ValueError:
+        return False
+
+
+def iter_json_records(buffer, filename):
+    """قراءة سجلات JSON كتدفق: سطر بسطر لملفات JSONL، أو عنصراً بعنصر من المصفوفة العلوية لملفات JSON."""
+    if filename.endswith('.jsonl') or _looks_like_jsonl(buffer):
+        for line in iter_buffer_lines(buffer):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+
+    stream = _JsonStream(buffer)
+    while True:
+        char = stream.peek()
+        if char is None:
+            return
+        if char == '[':
+            yield from stream.iter_array()
+        elif char == '{':
+            yield from stream.iter_object_records()
+        else:
+            yield stream.read_value()
+
+
+class _Column:
+    """عمود متفرق مُرمَّز بقاموس: كل قيمة فريدة تُخزن مرة واحدة، ولا يُخزن إلا (رقم الصف، الرمز) للصفوف
+    التي تحمل قيمة؛ الصفوف الغائبة لا تكلف شيئاً.
+
+    العمود غير المرشح لدور أمني يتوقف عن الترميز عند تجاوز STRUCTURED_DICTIONARY_LIMIT (معرفات مثلاً)
+    ويكتفي بعدّ القيم، لأنه سيُستبعد من الإسقاط على أي حال."""
+
+    __slots__ = ('rows', 'codes', 'labels', 'index', 'counts', 'present', 'role_candidate', 'overflow')
+
+    def __init__(self, role_candidate=False):
+        self.rows = array('I')
+        self.codes = array('I')
+        self.labels = ['']
+        self.index = {}
+        self.counts = [0]
+        self.present = 0
+        self.role_candidate = role_candidate
+        self.overflow = False
+
+    def add(self, row, value):
+        self.present += 1
+        if self.overflow:
+            return
+        code = self.index.get(value)
+        if code is None:
+            if len(self.labels) > STRUCTURED_DICTIONARY_LIMIT and not self._keep_indexing():
+                self.overflow = True
+                self.rows = self.codes = self.index = None
+                return
+            code = self.index[value] = len(self.labels)
+            self.labels.append(value)
+            self.counts.append(0)
+        self.counts[code] += 1
+        self.rows.append(row)
+        self.codes.append(code)
+
+    def _keep_indexing(self):
+        """عند تجاوز حد القاموس: يستمر الترميز فقط للأعمدة التي قد تأخذ دوراً أمنياً (بالاسم أو بقيم IP/وقت)."""
+        if not self.role_candidate:
+            self.role_candidate = (
+                self.value_ratio(IP_VALUE_PATTERN) >= 0.8 or self.value_ratio(TIMESTAMP_VALUE_PATTERN) >= 0.8
+            )
+        return self.role_candidate
+
+    def dense_codes(self, row_count):
+        """رموز كل الصفوف (0 للصفوف الغائبة) كمصفوفة كثيفة؛ تُبنى للأعمدة المُسقطة فقط."""
+        dense = np.zeros(row_count, dtype=np.uint32)
+        dense[np.frombuffer(self.rows, dtype=np.uint32)] = np.frombuffer(self.codes, dtype=np.uint32)
+        return array('I', dense.tobytes())
+
+    @property
+    def distinct(self):
+        return len(self.labels) - 1
+
+    def distinct_text(self):
+        return f"أكثر من {STRUCTURED_DICTIONARY_LIMIT}" if self.overflow else str(self.distinct)
+
+    def value_ratio(self, pattern, sample_size=100):
+        """نسبة القيم (من عينة القيم الفريدة) التي تطابق نمطاً معيناً."""
+        sample = self.labels[1:sample_size + 1]
+        if not sample:
+            return 0.0
+        return sum(1 for value in sample if pattern.match(value)) / len(sample)
+
+    def top_values(self, limit=STRUCTURED_TOP_VALUES):
+        codes = heapq.nlargest(limit, range(1, len(self.labels)), key=self.counts.__getitem__)
+        return [(self.labels[code], self.counts[code]) for code in codes]
+
+
+class ColumnarTable:
+    """تمثيل عمودي لسجل منظم يُبنى أثناء القراءة، مع اكتشاف الأعمدة الأمنية وإنتاج إسقاط مضغوط للنموذج."""
+
+    def __init__(self, source_format):
+        self.source_format = source_format
+        self.columns = {}
+        self.row_count = 0
+        self.untracked_values = 0  # قيم في أعمدة تجاوزت STRUCTURED_MAX_COLUMNS
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            if len(self.columns) >= STRUCTURED_MAX_COLUMNS:
+                return None
+            normalized = _normalize_column_name(name)
+            column = self.columns[name] = _Column(role_candidate=any(
+                pattern.search(normalized) for _, patterns, _ in SECURITY_COLUMN_ROLES for pattern in patterns
+            ))
+        return column
+
+    def append_row(self, columns, values):
+        """إضافة صف موضعي (CSV) باستخدام قائمة أعمدة محضرة مسبقاً."""
+        row = self.row_count
+        for column, value in zip(columns, values):
+            if value:
+                column.add(row, value)
+        self.row_count += 1
+
+    def append_record(self, record):
+        """إضافة سجل بمفاتيح (JSON) بعد تسطيحه؛ الأعمدة الغائبة لا تُسجَّل (التخزين متفرق)."""
+        row = self.row_count
+        for name, value in record.items():
+            column = self._column(name)
+            if column is None:
+                self.untracked_values += 1
+            else:
+                column.add(row, value)
+        self.row_count += 1
+
+    def detect_roles(self):
+        """تحديد الأعمدة ذات الصلة الأمنية (الوقت، IP المصدر/الوجهة، المستخدم، الإجراء، الحالة)."""
+        normalized = {name: _normalize_column_name(name) for name in self.columns}
+        roles = {}
+        for role, name_patterns, value_pattern in SECURITY_COLUMN_ROLES:
+            # الأنماط الأعلى أولوية تُجرب على كل الأعمدة قبل الأنماط الأعم
+            for name_pattern in name_patterns:
+                for name, column in self.columns.items():
+                    if name in roles.values() or column.overflow or not name_pattern.search(normalized[name]):
+                        continue
+                    if value_pattern is not None and column.value_ratio(value_pattern) < 0.5:
+                        continue
+                    roles[role] = name
+                    break
+                if role in roles:
+                    break
+
+        # أعمدة IP غير المسماة بوضوح: تُسند بالترتيب إلى المصدر ثم الوجهة
+        ip_columns = [
+            name for name, column in self.columns.items()
+            if name not in roles.values() and not column.overflow and column.value_ratio(IP_VALUE_PATTERN) >= 0.8
+        ]
+        for role in ("src_ip", "dst_ip"):
+            if role not in roles and ip_columns:
+                roles[role] = ip_columns.pop(0)
+
+        if "timestamp" not in roles:
+            for name, column in self.columns.items():
+                if name not in roles.values() and not column.overflow and column.value_ratio(TIMESTAMP_VALUE_PATTERN) >= 0.8:
+                    roles["timestamp"] = name
+                    break
+        return roles
+
+    def project(self):
+        """بناء إسقاط نصي مضغوط: ملخص (الأدوار، الإحصاءات، القواميس) وأسطر الأحداث المكررة مجمعة مع عدد تكرارها،
+        ومعها رموز الأحداث المجمعة (groups) لترتيبها حسب الشذوذ دون إعادة تحليل نصها."""
+        roles = self.detect_roles()
+        role_columns = [name for role, _, _ in SECURITY_COLUMN_ROLES for name in [roles.get(role)] if name]
+        # الأعمدة ذات القيمة الثابتة في كل الصفوف (أو الفارغة تماماً) تُذكر في الإحصاءات فقط؛
+        # أما العمود المتفرق بقيمة واحدة فيُرمَّز لأن وجود القيمة نفسه يميز الصفوف
+        constant_columns = [
+            name for name, column in self.columns.items()
+            if name not in role_columns and not column.overflow
+            and (column.distinct == 0 or (column.distinct == 1 and column.present == self.row_count))
+        ]
+        dropped_columns = [
+            name for name, column in self.columns.items()
+            if name not in role_columns and (column.overflow or column.distinct > STRUCTURED_DICTIONARY_LIMIT)
+        ]
+        encoded_columns = [
+            name for name in self.columns
+            if name not in role_columns and name not in constant_columns and name not in dropped_columns
+        ]
+        # عند تجاوز حد الأعمدة المُسقطة تُفضَّل الأعمدة الأكثر امتلاءً، والباقي يُلخص كأعمدة متفرقة مستبعدة
+        sparse_columns = []
+        event_limit = max(STRUCTURED_EVENT_COLUMNS - len(role_columns), 0)
+        if len(encoded_columns) > event_limit:
+            kept = set(sorted(encoded_columns, key=lambda name: -self.columns[name].present)[:event_limit])
+            sparse_columns = [name for name in encoded_columns if name not in kept]
+            encoded_columns = [name for name in encoded_columns if name in kept]
+
+        timestamp_name = roles.get("timestamp")
+        event_columns = [name for name in role_columns if name != timestamp_name] + encoded_columns
+
+        lines = [
+            f"[إسقاط عمودي لسجل منظم: {self.source_format.upper()}]",
+            f"عدد السجلات: {self.row_count} | الأعمدة الأصلية: {len(self.columns)} | الأعمدة المُسقطة: {len(role_columns) + len(encoded_columns)}",
+            "الأدوار المكتشفة: " + (", ".join(f"{role}={name}" for role, name in roles.items()) or "لا يوجد"),
+        ]
+        if dropped_columns:
+            lines.append("أعمدة مستبعدة عالية التباين: " + _listed_columns(
+                f"{name} ({self.columns[name].distinct_text()} قيمة فريدة)" for name in dropped_columns
+            ))
+        if sparse_columns:
+            lines.append(f"أعمدة متفرقة مستبعدة (تجاوزت حد {STRUCTURED_EVENT_COLUMNS} عموداً مُسقطاً): " + _listed_columns(
+                f"{name} ({self.columns[name].present} صف)" for name in sparse_columns
+            ))
+        if self.untracked_values:
+            lines.append(
+                f"قيم لم تُتتبع لتجاوز الحد الأقصى للأعمدة ({STRUCTURED_MAX_COLUMNS} عموداً): {self.untracked_values}"
+            )
+
+        lines.append("")
+        lines.append("[إحصاءات الأعمدة]")
+        # الأعمدة المُسقطة تُوصف كلها، أما المستبعدة والثابتة فبحد أقصى من الأسطر
+        described = dropped_columns + constant_columns
+        for name in role_columns + encoded_columns + described[:STRUCTURED_LISTED_COLUMNS]:
+            column = self.columns[name]
+            present = column.present
+            if name == timestamp_name:
+                labels, codes = column.labels, column.codes
+                summary = f"أول={labels[codes[0]] if codes else '-'}، آخر={labels[codes[-1]] if codes else '-'}"
+            elif column.overflow:
+                summary = "لم تُرمَّز قيمه لتجاوزها حد القاموس"
+            elif column.distinct == present:
+                summary = "كل القيم فريدة"
+            else:
+                summary = "الأكثر تكراراً: " + ", ".join(
+                    f"{_projection_cell(value)}×{count}" for value, count in column.top_values()
+                )
+            lines.append(f"{name}: غير فارغ={present}، فريد={column.distinct_text()}، {summary}")
+        if len(described) > STRUCTURED_LISTED_COLUMNS:
+            lines.append(f"... و{len(described) - STRUCTURED_LISTED_COLUMNS} عموداً آخر دون إحصاءات")
+
+        if encoded_columns:
+            lines.append("")
+            lines.append("[قواميس الترميز]")
+            for name in encoded_columns:
+                labels = self.columns[name].labels
+                entries = []
+                length = 0
+                for code in range(1, len(labels)):
+                    entry = f"{code}={_projection_cell(labels[code])}"
+                    length += len(entry) + 2
+                    if length > STRUCTURED_DICTIONARY_CHARS:
+                        entries.append(f"... (+{len(labels) - code} رمزاً غير معروض)")
+                        break
+                    entries.append(entry)
+                lines.append(f"{name}: " + ", ".join(entries))
+
+        header = ["التكرار"]
+        if timestamp_name:
+            header += ["أول ظهور", "آخر ظهور"]
+        lines.append("")
+        lines.append(f"[الأحداث المجمعة] ({'|'.join(header + event_columns)})")
+        events, keys, counts = self._grouped_events(timestamp_name, event_columns, set(encoded_columns))
+        groups = {"columns": event_columns, "roles": roles, "keys": keys, "counts": counts}
+        return "\n".join(lines), events, groups
+
+    def _grouped_events(self, timestamp_name, event_columns, encoded_columns):
+        """تجميع الصفوف المتطابقة في الأعمدة المُسقطة (باستثناء الوقت) بترتيب أول ظهور.
+        يعيد أسطر الأحداث، ورموز كل حدث (حدث × عمود)، وعدد تكرار كل حدث."""
+        groups = {}
+        code_arrays = [self.columns[name].dense_codes(self.row_count) for name in event_columns]
+        timestamps = self.columns[timestamp_name].dense_codes(self.row_count) if timestamp_name else None
+        keys = zip(*code_arrays) if code_arrays else repeat((), self.row_count)
+        for row, key in enumerate(keys):
+            group = groups.get(key)
+            if group is None:
+                ts_code = timestamps[row] if timestamps is not None else 0
+                groups[key] = [1, ts_code, ts_code]
+            else:
+                group[0] += 1
+                if timestamps is not None:
+                    group[2] = timestamps[row]
+
+        timestamp_labels = self.columns[timestamp_name].labels if timestamp_name else None
+        events = []
+        for key, (count, first_ts, last_ts) in groups.items():
+            cells = [str(count)]
+            if timestamp_labels is not None:
+                cells += [timestamp_labels[first_ts] or '-', timestamp_labels[last_ts] or '-']
+            for name, code in zip(event_columns, key):
+                if code == 0:
+                    cells.append('-')
+                elif name in encoded_columns:
+                    cells.append(str(code))
+                else:
+                    cells.append(_projection_cell(self.columns[name].labels[code]))
+            events.append("|".join(cells))
+        keys = np.array(list(groups), dtype=np.int64).reshape(len(groups), len(event_columns))
+        counts = np.fromiter((group[0] for group in groups.values()), dtype=np.int64, count=len(groups))
+        return events, keys, counts
+
+
+def _normalize_column_name(name):
+    """توحيد اسم العمود لمطابقة أنماط الأدوار (userIdentity.userName ← useridentity_username)."""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _listed_columns(items):
+    """قائمة أسماء أعمدة مختصرة: أول STRUCTURED_LISTED_COLUMNS منها ثم عدد الباقي."""
+    items = list(items)
+    text = ", ".join(items[:STRUCTURED_LISTED_COLUMNS])
+    if len(items) > STRUCTURED_LISTED_COLUMNS:
+        text += f"، ... و{len(items) - STRUCTURED_LISTED_COLUMNS} أخرى"
+    return text
+
+
+def _projection_cell(value, max_length=200):
+    """تنظيف قيمة لإدراجها في سطر الإسقاط (بدون فواصل أعمدة أو أسطر جديدة)."""
+    value = value.replace('|', '¦').replace('\n', ' ').replace('\r', ' ')
+    return value if len(value) <= max_length else value[:max_length] + '…'
+
+
+def parse_structured_log(buffer, filename):
+    """قراءة ملف CSV/JSON/JSONL من المخزن كتدفق وبناء تمثيله العمودي."""
+    if filename.endswith('.csv'):
+        table = ColumnarTable('csv')
+        reader = csv.reader(iter_buffer_lines(buffer))
+        header = next(reader, None)
+        if not header:
+            return table
+        # أسماء الأعمدة المكررة تحصل على لاحقة رقمية
+        names = []
+        for position, name in enumerate(header):
+            name = name.strip() or f"column_{position + 1}"
+            names.append(name if name not in names else f"{name}_{position + 1}")
+        columns = [table._column(name) for name in names[:STRUCTURED_MAX_COLUMNS]]
+        for values in reader:
+            if values:
+                table.append_row(columns, values[:len(columns)])
+        return table
+
+    table = ColumnarTable('jsonl' if filename.endswith('.jsonl') else 'json')
+    for record in iter_json_records(buffer, filename):
+        table.append_record(flatten_record(record if isinstance(record, dict) else {"value": record}))
+    return table
+
+
+# =====================================================================
+# الترتيب الإحصائي للأسطر حسب الشذوذ قبل إرسالها إلى النموذج
 # =====================================================================
+# الحد الأقصى لحجم محتوى السجل في الموجه؛ عند تجاوزه تُرسل الأسطر الأعلى شذوذاً مع سياقها فقط
+PROMPT_CHAR_BUDGET = int(os.environ.get('PROMPT_CHAR_BUDGET', '500000'))
+ANOMALY_CONTEXT_LINES = int(os.environ.get('ANOMALY_CONTEXT_LINES', '2'))
+ANOMALY_TOP_LINES = 50  # عدد الأسطر الأعلى شذوذاً المعروضة في الاستجابة
+ANOMALY_BLOCK_BYTES = 1 << 20  # حجم كتلة المسح؛ الذاكرة المؤقتة تتناسب مع الكتلة لا مع حجم الملف
+EVIDENCE_LINE_CHARS = 2000  # الأسطر الأطول من ذلك تُقتطع داخل الموجه
+EVIDENCE_MISSES_LIMIT = 1000  # إيقاف الاختيار بعد هذا العدد من الأسطر المتتالية التي لا تتسع للميزانية
+
+# وحدات الأدلة: الأسطر الخام تُرقّم بموقعها في الملف، والأحداث المجمعة بترتيبها في الإسقاط
+EVIDENCE_UNITS = {
+    "line": {"prefix": "L", "noun": "سطراً"},
+    "event": {"prefix": "E", "noun": "حدثاً"},
+}
+
+# أوزان مكونات درجة الشذوذ
+ANOMALY_WEIGHTS = {
+    "template_rarity": 0.30,
+    "ip_rarity": 0.15,
+    "burst": 0.20,
+    "new_user_host": 0.15,
+    "error": 0.20,
+}
+
+# تخطيطات الطوابع الزمنية حتى مستوى الدقيقة (d رقم، D رقم أو مسافة، A حرف كبير، a حرف صغير، T حرف T أو مسافة)
+LOG_TIME_LAYOUTS = (
+    'dddd-dd-ddTdd:dd',   # ISO 8601
+    'dd/Aaa/dddd:dd:dd',  # Apache/Nginx
+    'Aaa Dd dd:dd',       # Syslog
+)
+LOG_USER_MAX_LENGTH = 64
+LOG_USER_SEPARATORS_LIMIT = 8  # أقصى عدد من الفواصل [=: ] بين الكلمة المفتاحية واسم المستخدم
+# أنماط المستخدم: (الكلمة المفتاحية، لاحقة اختيارية بعدها، هل يلزم فاصل من [=: ]، النص المطلوب بعد الاسم)،
+# أي user(name)?[=: ]+NAME و " for (invalid user )?NAME from " و login[=: ]+NAME
+LOG_USER_PATTERNS = (
+    (b'user', b'name', True, b''),
+    (b' for ', b'invalid user ', False, b' from '),
+    (b'login', b'', True, b''),
+)
+LOG_ERROR_KEYWORDS = (
+    b'fail', b'error', b'denied', b'invalid', b'refused', b'unauthori', b'forbidden',
+    b'blocked', b'reject', b'critical', b'alert', b'panic',
+)
+# الكلمات المفتاحية تُبحث على نسخة صغيرة الأحرف من كل كتلة على حدة (لا من الملف كاملاً) بمسح واحد لكل الكلمات؛
+# رموز حالة HTTP 4xx/5xx تُطابق كتخطيطات على الكتلة الأصلية
+LOG_LITERALS = LOG_ERROR_KEYWORDS + tuple(keyword for keyword, _, _, _ in LOG_USER_PATTERNS)
+LOG_ERROR_STATUS_LAYOUTS = ('" 4dd ', '" 5dd ')
+
+_BYTE_VALUES = np.arange(256)
+USER_NAME_TABLE = np.isin(_BYTE_VALUES, np.frombuffer(b'abcdefghijklmnopqrstuvwxyz0123456789_.@$-\x7f`', dtype=np.uint8))
+USER_SEPARATOR_TABLE = np.isin(_BYTE_VALUES, np.frombuffer(b'=: ', dtype=np.uint8))
+
+# تجزئة المقاطع بقراءة 8 بايتات في كل خطوة وخلطها بطريقة هورنر (modulo 2**64)
+HASH_BASE = np.uint64(0x100000001B3)
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)  # ينشر المفاتيح الرقمية الصغيرة إلى البتات العليا قبل ترميزها
+HASH_SEGMENT_BYTES = 1024  # المقاطع الأطول (أسطر طويلة نادرة) تُجزأ ببايثون بدلاً من حلقة متجهة طويلة
+LITERAL_HASH_BITS = 12
+LITERAL_HASH_MIX = np.uint32(0x9E3779B1)
+
+
+def _overlapping_view(data, dtype):
+    """عرض متداخل (دون نسخ) يقرأ عدداً بحجم dtype يبدأ عند كل بايت من المصفوفة."""
+    size = np.dtype(dtype).itemsize
+    return np.ndarray((max(len(data) - size + 1, 0),), dtype=dtype, buffer=data, strides=(1,))
+
+
+def _hash_segments(data, starts, ends):
+    """تجزئة مقاطع (أسطر القوالب، عناوين، طوابع زمنية، أسماء مستخدمين) بطريقة هورنر على كلمات من 8 بايتات
+    عبر عرض متداخل للمصفوفة. المقاطع مرتبة تنازلياً حسب الطول، فالمقاطع التي لم تنتهِ بعد في كل خطوة
+    شريحة من بدايتها؛ والنتيجة تعتمد على المحتوى وحده."""
+    lengths = (ends - starts).astype(np.int64)
+    hashes = lengths.astype(np.uint64)
+    if len(data) < 8:
+        data = np.concatenate((data, np.zeros(8, dtype=np.uint8)))
+    words = _overlapping_view(data, '<u8')
+    last = len(words) - 1
+    order = np.flatnonzero((lengths > 0) & (lengths <= HASH_SEGMENT_BYTES))
+    order = order[np.argsort(-lengths[order], kind='stable')]
+    segment_starts = starts[order]
+    segment_lengths = lengths[order]
+    segment_hashes = hashes[order]
+    count = len(order)
+    offset = 0
+    while count:
+        at = segment_starts[:count] + offset
+        word = words[np.minimum(at, last)]
+        # قرب نهاية المصفوفة تُقرأ آخر كلمة كاملة وتُزاح إلى موضع المقطع
+        beyond = at > last
+        if beyond.any():
+            word[beyond] >>= ((at[beyond] - last) * 8).astype(np.uint64)
+        remaining = segment_lengths[:count] - offset
+        partial = remaining < 8
+        if partial.any():
+            word[partial] &= (np.uint64(1) << (remaining[partial] * 8).astype(np.uint64)) - np.uint64(1)
+        segment_hashes[:count] ^= word
+        segment_hashes[:count] *= HASH_BASE
+        offset += 8
+        count = int(np.count_nonzero(segment_lengths[:count] > offset))
+    hashes[order] = segment_hashes
+    for segment in np.flatnonzero(lengths > HASH_SEGMENT_BYTES):
+        hashes[segment] = hash(data[starts[segment]:ends[segment]].tobytes()) & 0xFFFFFFFFFFFFFFFF
+    return hashes
+
+
+def _digit_run(digits, positions, step, limit=4):
+    """طول تسلسل الأرقام (حتى limit) بدءاً من كل موضع باتجاه step؛ ما خارج الكتلة ليس رقماً."""
+    length = np.zeros(len(positions), dtype=np.int64)
+    running = np.ones(len(positions), dtype=bool)
+    for offset in range(limit):
+        at = positions + offset * step
+        running &= (at >= 0) & (at < len(digits)) & digits[np.clip(at, 0, len(digits) - 1)]
+        length += running
+    return length
+
+
+def _line_spans(block):
+    """بدايات ونهايات (دون فاصل السطر) أسطر كتلة؛ المقطع الأخير يُحسب سطراً إن لم يكن فارغاً."""
+    newlines = np.flatnonzero(block == 10)
+    if len(block) and block[-1] != 10:
+        ends = np.append(newlines, len(block))
+    else:
+        ends = newlines
+    starts = np.concatenate(([0], newlines + 1))[:len(ends)]
+    return starts, ends
+
+
+def _iter_line_blocks(data):
+    """تقسيم المخزن إلى كتل (عروض دون نسخ) بحجم ANOMALY_BLOCK_BYTES تقريباً تنتهي عند نهاية سطر."""
+    start = 0
+    while start < len(data):
+        end = start + ANOMALY_BLOCK_BYTES
+        while end < len(data):
+            found = data[end - 1:end - 1 + ANOMALY_BLOCK_BYTES] == 10
+            first = int(found.argmax())
+            if found[first]:
+                end += first
+                break
+            end += len(found)
+        end = min(end, len(data))
+        yield start, data[start:end]
+        start = end
+
+
+def _find_layout(data, layout):
+    """مواضع بداية نمط بطول ثابت عبر مقارنات متجهة، بدءاً من حرف ثابت في التخطيط لتقليل المرشحين."""
+    anchor = next(offset for offset, char in enumerate(layout) if char not in 'dDAaT ')
+    positions = np.flatnonzero(data == ord(layout[anchor])) - anchor
+    positions = positions[(positions >= 0) & (positions + len(layout) <= len(data))]
+    for offset, char in enumerate(layout):
+        if offset == anchor or len(positions) == 0:
+            continue
+        values = data[positions + offset]
+        if char == 'd':
+            keep = (values - 48) < 10
+        elif char == 'D':
+            keep = ((values - 48) < 10) | (values == 32)
+        elif char == 'A':
+            keep = (values - 65) < 26
+        elif char == 'a':
+            keep = (values - 97) < 26
+        elif char == 'T':
+            keep = (values == 84) | (values == 32)
+        else:
+            keep = values == ord(char)
+        positions = positions[keep]
+    return positions
+
+
+def _has_literal(data, positions, literal):
+    """هل يبدأ النص الثابت literal (قد يكون فارغاً) عند كل موضع."""
+    match = positions + len(literal) <= len(data)
+    for offset, value in enumerate(literal):
+        match &= data[np.minimum(positions + offset, len(data) - 1)] == value
+    return match
+
+
+def _find_literals(data, literals):
+    """مواضع عدة نصوص ثابتة (4 بايتات فأكثر) بمسح واحد: البايتات الأربع عند كل موضع تُقرأ كعدد uint32
+    (عرض لكل محاذاة) وتُجزأ إلى جدول صغير يضم بادئات النصوص، ثم يُتحقق من المرشحين القلائل لكل نص."""
+    prefixes = np.array([int.from_bytes(literal[:4], 'little') for literal in literals], dtype=np.uint32)
+    shift = np.uint32(32 - LITERAL_HASH_BITS)
+    table = np.zeros(1 << LITERAL_HASH_BITS, dtype=bool)
+    table[(prefixes * LITERAL_HASH_MIX) >> shift] = True
+    candidates = []
+    for alignment in range(4):
+        count = max(len(data) - alignment, 0) // 4
+        values = data[alignment:alignment + count * 4].view('<u4')
+        candidates.append(np.flatnonzero(np.take(table, (values * LITERAL_HASH_MIX) >> shift)) * 4 + alignment)
+    candidates = np.concatenate(candidates)
+    values = _overlapping_view(data, '<u4')[candidates]
+    found = {}
+    for literal, prefix in zip(literals, prefixes):
+        positions = candidates[values == prefix]
+        found[literal] = positions[_has_literal(data, positions + 4, literal[4:])]
+    return found
+
+
+def _first_per_line(ends, positions, values):
+    """أول قيمة في كل سطر: (أرقام الأسطر، القيم) من مواضع التطابقات داخل الكتلة."""
+    if np.any(positions[1:] < positions[:-1]):
+        # المواضع المجمعة من عدة أنماط تحتاج إلى ترتيب
+        order = np.argsort(positions, kind='stable')
+        positions, values = positions[order], values[order]
+    lines = np.searchsorted(ends, positions)
+    first = np.diff(lines, prepend=-1) != 0
+    return lines[first], values[first]
+
+
+def _find_users(folded, found):
+    """مواضع بداية ونهاية أسماء المستخدمين وفق LOG_USER_PATTERNS، بعمليات متجهة على مواضع الكلمات المفتاحية."""
+    user_starts = []
+    user_ends = []
+    name_breaks = None
+    for keyword, optional, separated, suffix in LOG_USER_PATTERNS:
+        positions = found[keyword] + len(keyword)
+        if len(positions) == 0:
+            continue
+        positions = positions + _has_literal(folded, positions, optional) * len(optional)
+        if separated:
+            # فاصل واحد على الأقل من [=: ]
+            skipped = np.zeros(len(positions), dtype=np.int64)
+            running = np.ones(len(positions), dtype=bool)
+            for _ in range(LOG_USER_SEPARATORS_LIMIT):
+                at = positions + skipped
+                running &= (at < len(folded)) & USER_SEPARATOR_TABLE[folded[np.minimum(at, len(folded) - 1)]]
+                skipped += running
+            positions = (positions + skipped)[skipped > 0]
+        if name_breaks is None:
+            name_breaks = np.append(np.flatnonzero(~USER_NAME_TABLE[folded]), len(folded))
+        ends = name_breaks[np.searchsorted(name_breaks, positions)]
+        valid = (ends > positions) & _has_literal(folded, ends, suffix)
+        user_starts.append(positions[valid])
+        user_ends.append(np.minimum(ends[valid], positions[valid] + LOG_USER_MAX_LENGTH))
+    if not user_starts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(user_starts), np.concatenate(user_ends)
+
+
+def _scan_block(block, offset, features, line):
+    """استخراج خصائص أسطر كتلة تبدأ عند الإزاحة offset وكتابتها في مصفوفات features المحجوزة مسبقاً بدءاً من
+    السطر line: المواضع وتجزئات القالب وعنوان IP والدقيقة والمستخدم، وهل السطر خطأ. يعيد عدد أسطر الكتلة.
+    كل المصفوفات المؤقتة بحجم الكتلة فقط."""
+    starts, ends = _line_spans(block)
+    lines = slice(line, line + len(ends))
+    features["starts"][lines] = starts + offset
+    features["ends"][lines] = ends + offset
+
+    def assign(name, positions, values):
+        found_lines, values = _first_per_line(ends, positions, values)
+        features[name][found_lines + line] = values
+        features[name + "_present"][found_lines + line] = True
+
+    # 1. القالب: كل تسلسل أرقام يصبح # واحدة، ثم تجزئة كل سطر من النسخة المختصرة (بحجم الكتلة فقط)
+    digits = (block - 48) < 10
+    keep = np.empty(len(block), dtype=bool)
+    keep[:1] = True
+    np.logical_and(digits[1:], digits[:-1], out=keep[1:])
+    np.logical_not(keep[1:], out=keep[1:])
+    template = np.compress(keep, block)
+    del keep
+    np.putmask(template, (template - 48) < 10, 35)
+    template_starts, template_ends = _line_spans(template)
+    features["template"][lines] = _hash_segments(template, template_starts, template_ends)
+    del template, template_starts, template_ends
+
+    # 2. عناوين IPv4: ثلاث نقاط متتالية بين أرقام تفصل بينها مقاطع من 1 إلى 3 أرقام
+    dots = np.flatnonzero(block[1:-1] == 46) + 1
+    dots = dots[digits[dots - 1] & digits[dots + 1]]
+    first, second, third = dots[:-2], dots[1:-1], dots[2:]
+    candidates = (second - first <= 4) & (third - second <= 4)
+    first, second, third = first[candidates], second[candidates], third[candidates]
+    lead = _digit_run(digits, first - 1, -1)
+    tail = _digit_run(digits, third + 1, 1)
+    ip_starts = first - lead
+    ip_ends = third + 1 + tail
+    valid = (
+        (lead <= 3) & (tail <= 3)
+        & (_digit_run(digits, first + 1, 1) == second - first - 1)
+        & (_digit_run(digits, second + 1, 1) == third - second - 1)
+        # العنوان لا يكون جزءاً من تسلسل نقاط أطول مثل أرقام الإصدارات
+        & (block[np.maximum(ip_starts - 1, 0)] != 46)
+        & (block[np.minimum(ip_ends, len(block) - 1)] != 46)
+    )
+    assign("ip", ip_starts[valid], _hash_segments(block, ip_starts[valid], ip_ends[valid]))
+    del dots, digits
+
+    # 3. الدقيقة الزمنية وفق أول تخطيط معروف في السطر
+    time_positions = []
+    time_hashes = []
+    for layout in LOG_TIME_LAYOUTS:
+        positions = _find_layout(block, layout)
+        time_positions.append(positions)
+        time_hashes.append(_hash_segments(block, positions, positions + len(layout)))
+    assign("time", np.concatenate(time_positions), np.concatenate(time_hashes))
+
+    # 4. المستخدم (دون حساسية لحالة الأحرف): طي البت 0x20 يحول A-Z إلى a-z في عملية واحدة، ولا يغير
+    # الأرقام والمسافة و"=:.-$" المستخدمة في الأنماط ('_' و'@' يتحولان إلى رموز تقبلها USER_NAME_TABLE أيضاً)
+    folded = block | np.uint8(0x20)
+    found = _find_literals(folded, LOG_LITERALS)
+    user_starts, user_ends = _find_users(folded, found)
+    if len(user_starts):
+        assign("user", user_starts, _hash_segments(folded, user_starts, user_ends))
+
+    # 5. أسطر الأخطاء
+    error_positions = [found[keyword] for keyword in LOG_ERROR_KEYWORDS]
+    error_positions += [_find_layout(block, layout) for layout in LOG_ERROR_STATUS_LAYOUTS]
+    features["is_error"][np.searchsorted(ends, np.concatenate(error_positions)) + line] = True
+    return len(ends)
+
+
+def _hash_codes(hashes, present=None):
+    """تحويل تجزئات الأسطر إلى رموز متتالية (‎-1‎ للأسطر بلا قيمة) مع عدد تكرار كل رمز وأول سطر يحمله.
+
+    بدلاً من np.unique (الذي يرتب الفهارس بـ argsort البطيء) تُرتب قيم مدمجة بـ np.sort: البتات العليا من
+    التجزئة ورقم السطر في البتات الدنيا. فقدان البتات الدنيا يرفع احتمال التصادم قليلاً دون أثر يُذكر على الندرة."""
+    codes = np.full(len(hashes), -1, dtype=np.int32 if len(hashes) < 2 ** 31 else np.int64)
+    lines = np.arange(len(hashes), dtype=np.uint64) if present is None else np.flatnonzero(present).astype(np.uint64)
+    if len(lines) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return codes, empty, empty
+    line_mask = np.uint64((1 << len(hashes).bit_length()) - 1)
+    packed = hashes if present is None else hashes[lines]
+    packed = np.sort((packed & ~line_mask) | lines)
+    del lines
+    keys = packed & ~line_mask
+    new_code = np.empty(len(packed), dtype=bool)
+    new_code[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=new_code[1:])
+    del keys
+    packed &= line_mask
+    packed_lines = packed.astype(np.int64)
+    del packed
+    codes[packed_lines] = np.cumsum(new_code) - 1
+    code_starts = np.flatnonzero(new_code)
+    counts = np.diff(np.append(code_starts, len(new_code)))
+    return codes, counts, packed_lines[code_starts]
+
+
+def _rarity(codes, counts, total):
+    """ندرة كل سطر وفق تكرار رمزه: ‎-log(p)‎ مطبّعة إلى [0, 1]؛ الأسطر بلا رمز تحصل على 0."""
+    rarity = np.zeros(len(codes), dtype=np.float32)
+    present = codes >= 0
+    if total > 1 and present.any():
+        rarity[present] = -np.log(counts[codes[present]] / total) / np.log(total)
+    return rarity
+
+
+class LineScores:
+    """درجات الشذوذ لأسطر مخزن مع مواضعها؛ نص السطر وعدد أحرفه يُقرآن من المخزن عند الحاجة فقط."""
+
+    def __init__(self, starts, ends, scores, components):
+        self.starts = starts
+        self.ends = ends
+        self.scores = scores
+        self.components = components
+        self._chars = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def text(self, buffer, line):
+        """نص السطر line من المخزن (فك الترميز متسامح لأن السطر قد يكون مقتطعاً من ملف غير سليم)."""
+        return str(buffer[int(self.starts[line]):int(self.ends[line])], 'utf-8', 'replace').rstrip()
+
+    def chars(self, buffer):
+        """عدد الأحرف (لا البايتات) لكل سطر: بايتات UTF-8 التالية 10xxxxxx لا تبدأ حرفاً جديداً.
+        يُحسب على كتل المخزن عند أول طلب فقط."""
+        if self._chars is None:
+            chars = self.ends - self.starts
+            data = np.frombuffer(buffer, dtype=np.uint8)
+            for start in range(0, len(data), ANOMALY_BLOCK_BYTES):
+                continuation = np.flatnonzero((data[start:start + ANOMALY_BLOCK_BYTES] & 0xC0) == 0x80)
+                if len(continuation):
+                    lines = np.searchsorted(self.ends, continuation + start)
+                    counts = np.bincount(lines - lines[0])
+                    chars[lines[0]:lines[0] + len(counts)] -= counts.astype(chars.dtype)
+            self._chars = chars
+        return self._chars
+
+    def fits(self, buffer, char_budget):
+        """هل يتسع النص كاملاً (مع فواصل الأسطر) للميزانية؛ عدد البايتات حد أعلى لعدد الأحرف،
+        فلا تُعد الأحرف إلا إن تجاوزت البايتات الميزانية."""
+        if int((self.ends - self.starts).sum()) + len(self) <= char_budget:
+            return True
+        return int(self.chars(buffer).sum()) + len(self) <= char_budget
+
+
+def score_log_lines(buffer):
+    """حساب درجة شذوذ لكل سطر (0 إلى 1 تقريباً) من ندرة القالب وعنوان IP والاندفاعات الزمنية
+    وأزواج المستخدم/المضيف الجديدة ونسبة الأخطاء، مباشرة على المخزن (mmap أو bytes) دون فك ترميزه.
+
+    المسح يتم على كتل بعمليات NumPy متجهة، ولا يُحتفظ إلا بمصفوفات رقمية لكل سطر محجوزة مسبقاً."""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    # عدد الأسطر أولاً لحجز مصفوفات الخصائص مرة واحدة؛ الإزاحات بـ int32 ما دام المخزن أصغر من 2GB
+    line_count = sum(
+        int(np.count_nonzero(data[start:start + ANOMALY_BLOCK_BYTES] == 10))
+        for start in range(0, len(data), ANOMALY_BLOCK_BYTES)
+    )
+    if len(data) and data[-1] != 10:
+        line_count += 1
+    offset_type = np.int32 if len(data) < 2 ** 31 else np.int64
+    features = {
+        "starts": np.empty(line_count, dtype=offset_type),
+        "ends": np.empty(line_count, dtype=offset_type),
+        "template": np.empty(line_count, dtype=np.uint64),
+        "is_error": np.zeros(line_count, dtype=bool),
+    }
+    for name in ("ip", "time", "user"):
+        features[name] = np.zeros(line_count, dtype=np.uint64)
+        features[name + "_present"] = np.zeros(line_count, dtype=bool)
+    line = 0
+    for offset, block in _iter_line_blocks(data):
+        line += _scan_block(block, offset, features, line)
+    del data
+
+    if line_count == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return LineScores(features["starts"], features["ends"], empty, {name: empty for name in ANOMALY_WEIGHTS})
+
+    # 1. ندرة القالب
+    templates, template_counts, _ = _hash_codes(features.pop("template"))
+    template_rarity = _rarity(templates, template_counts, line_count)
+    del templates, template_counts
+
+    # 2. ندرة عنوان IP
+    ips, ip_counts, _ = _hash_codes(features.pop("ip"), features.pop("ip_present"))
+    with_ip = ips >= 0
+    ip_rarity = _rarity(ips, ip_counts, int(with_ip.sum()))
+
+    # 3. الاندفاع الزمني: عدد أسطر نفس IP في نفس الدقيقة مقارنة بالوسيط
+    buckets, bucket_counts, _ = _hash_codes(features.pop("time"), features.pop("time_present"))
+    burst = np.zeros(line_count, dtype=np.float32)
+    timed = buckets >= 0
+    if timed.any():
+        keys = ((ips.astype(np.int64) + 1) * len(bucket_counts) + buckets).astype(np.uint64) * HASH_MIX
+        key_codes, key_counts, _ = _hash_codes(keys, timed)
+        del keys
+        ratio = key_counts[key_codes[timed]] / max(np.median(key_counts), 1.0)
+        burst[timed] = np.log1p(ratio) / np.log1p(max(ratio.max(), 1.0))
+        del key_codes
+    del buckets
+
+    # 4. أزواج المستخدم/المضيف الجديدة: أول ظهور لزوج نادر
+    users, _, _ = _hash_codes(features.pop("user"), features.pop("user_present"))
+    new_user_host = np.zeros(line_count, dtype=np.float32)
+    paired = users >= 0
+    if paired.any():
+        pairs = (users.astype(np.int64) * (len(ip_counts) + 1) + (ips + 1)).astype(np.uint64) * HASH_MIX
+        pair_codes, pair_counts, first_lines = _hash_codes(pairs, paired)
+        del pairs
+        pair_rarity = 1.0 / pair_counts
+        new_user_host[paired] = pair_rarity[pair_codes[paired]] * 0.5
+        new_user_host[first_lines] += pair_rarity * 0.5
+        del pair_codes
+    del users
+
+    # 5. الأخطاء: سطر خطأ مرجّح بنسبة أخطاء عنوان IP المرتبط به
+    is_error = features.pop("is_error").astype(np.float32)
+    error = is_error * 0.5
+    if with_ip.any():
+        ip_totals = np.bincount(ips[with_ip], minlength=len(ip_counts))
+        ip_errors = np.bincount(ips[with_ip], weights=is_error[with_ip], minlength=len(ip_counts))
+        error[with_ip] += is_error[with_ip] * 0.5 * (ip_errors / np.maximum(ip_totals, 1))[ips[with_ip]]
+    del ips, is_error
+
+    components = {
+        "template_rarity": template_rarity,
+        "ip_rarity": ip_rarity,
+        "burst": burst,
+        "new_user_host": new_user_host,
+        "error": error,
+    }
+    scores = sum(np.float32(ANOMALY_WEIGHTS[name]) * values for name, values in components.items())
+    # الأسطر الفارغة لا تحمل دليلاً
+    scores[features["ends"] == features["starts"]] = 0.0
+    return LineScores(features["starts"], features["ends"], scores, components)
+
+
+def _value_rarity(column, row_count):
+    """ندرة كل رمز في قاموس عمود من عدد تكراره في الجدول (الرمز 0 للصفوف الغائبة)، مطبّعة إلى [0, 1]."""
+    counts = np.array(column.counts, dtype=np.float64)
+    counts[0] = row_count - column.present
+    if row_count <= 1:
+        return np.zeros(len(counts), dtype=np.float32)
+    return (-np.log(np.maximum(counts, 1) / row_count) / np.log(row_count)).astype(np.float32)
+
+
+def _error_labels(name, labels):
+    """قيم القاموس التي تدل على خطأ: كلمات الأخطاء، رموز 4xx/5xx، أو أي قيمة في عمود اسمه يحتوي error."""
+    named = 'error' in _normalize_column_name(name)
+    keywords = [keyword.decode() for keyword in LOG_ERROR_KEYWORDS]
+    flags = np.zeros(len(labels), dtype=bool)
+    for code in range(1, len(labels)):
+        value = labels[code].strip().lower()
+        flags[code] = (
+            (named and value not in ('', '0', '-', 'none', 'null', 'false'))
+            or any(keyword in value for keyword in keywords)
+            or (len(value) == 3 and value[0] in '45' and value.isdigit())
+        )
+    return flags
+
+
+def score_events(table, groups, buffer):
+    """درجات شذوذ الأحداث المجمعة لإسقاط منظم بنفس مكونات score_log_lines، لكن من رموز الأعمدة وعدد
+    تكرارها في الجدول مباشرة بدلاً من إعادة تحليل نص الأحداث (الذي يتحول فيه كل رمز إلى أرقام).
+
+    groups كما يعيدها ColumnarTable.project() لجدول غير فارغ؛ buffer نص الأحداث (سطر لكل حدث) لمواضع الأسطر فقط."""
+    starts, ends = _line_spans(np.frombuffer(buffer, dtype=np.uint8))
+    columns, roles = groups["columns"], groups["roles"]
+    keys, counts = groups["keys"], groups["counts"]
+    group_count = len(counts)
+    positions = {name: index for index, name in enumerate(columns)}
+    src_ip = roles.get("src_ip") if roles.get("src_ip") in positions else None
+    user = roles.get("user") if roles.get("user") in positions else None
+
+    # 1. ندرة القالب: متوسط ندرة قيم الأعمدة غير IP في الحدث
+    template_rarity = np.zeros(group_count, dtype=np.float32)
+    ip_columns = {roles.get("src_ip"), roles.get("dst_ip")}
+    template_columns = [name for name in columns if name not in ip_columns]
+    for name in template_columns:
+        template_rarity += _value_rarity(table.columns[name], table.row_count)[keys[:, positions[name]]]
+    if template_columns:
+        template_rarity /= len(template_columns)
+
+    # 2. ندرة عنوان IP بين الصفوف التي تحمل عنواناً
+    ip_rarity = np.zeros(group_count, dtype=np.float32)
+    if src_ip is not None:
+        ips = keys[:, positions[src_ip]]
+        with_ip = ips > 0
+        ip_rarity[with_ip] = _value_rarity(table.columns[src_ip], table.columns[src_ip].present)[ips[with_ip]]
+
+    # 3. الاندفاع: تكرار الحدث مقارنة بوسيط تكرار الأحداث
+    ratio = counts / max(float(np.median(counts)), 1.0)
+    burst = (np.log1p(ratio) / np.log1p(max(ratio.max(), 1.0))).astype(np.float32)
+
+    # 4. أزواج المستخدم/المضيف النادرة، مع مكافأة لأول حدث يظهر فيه الزوج
+    new_user_host = np.zeros(group_count, dtype=np.float32)
+    if user is not None:
+        users = keys[:, positions[user]]
+        paired = users > 0
+        if paired.any():
+            ips = keys[:, positions[src_ip]] if src_ip is not None else np.zeros(group_count, dtype=np.int64)
+            pairs = users * (len(table.columns[src_ip].labels) if src_ip is not None else 1) + ips
+            _, first_groups, pair_codes = np.unique(pairs[paired], return_index=True, return_inverse=True)
+            pair_rarity = 1.0 / np.bincount(pair_codes, weights=counts[paired])
+            new_user_host[paired] = pair_rarity[pair_codes] * 0.5
+            new_user_host[np.flatnonzero(paired)[first_groups]] += pair_rarity * 0.5
+
+    # 5. الأخطاء: قيم الحالة/الإجراء الدالة على خطأ، مرجّحة بنسبة أخطاء عنوان IP (بعدد الصفوف)
+    is_error = np.zeros(group_count, dtype=bool)
+    for name in columns:
+        if name in (roles.get("status"), roles.get("action")) or 'error' in _normalize_column_name(name):
+            is_error |= _error_labels(name, table.columns[name].labels)[keys[:, positions[name]]]
+    is_error = is_error.astype(np.float32)
+    error = is_error * 0.5
+    if src_ip is not None:
+        ips = keys[:, positions[src_ip]]
+        with_ip = ips > 0
+        if with_ip.any():
+            ip_totals = np.bincount(ips[with_ip], weights=counts[with_ip], minlength=len(table.columns[src_ip].labels))
+            ip_errors = np.bincount(
+                ips[with_ip], weights=(counts * is_error)[with_ip], minlength=len(table.columns[src_ip].labels)
+            )
+            error[with_ip] += is_error[with_ip] * 0.5 * (ip_errors / np.maximum(ip_totals, 1))[ips[with_ip]]
+
+    components = {
+        "template_rarity": template_rarity,
+        "ip_rarity": ip_rarity,
+        "burst": burst,
+        "new_user_host": new_user_host,
+        "error": error,
+    }
+    scores = sum(np.float32(ANOMALY_WEIGHTS[name]) * values for name, values in components.items())
+    return LineScores(starts, ends, scores, components)
+
+
+def select_evidence(buffer, line_scores, char_budget, unit="line", context=ANOMALY_CONTEXT_LINES):
+    """اختيار الأسطر الأعلى درجة مع نافذة سياق حولها ضمن الميزانية، ثم ترتيبها حسب موقعها الأصلي.
+
+    الميزانية تشمل بادئة الرقم وفواصل الأسطر وعلامات الحذف؛ النافذة التي لا تتسع تُختصر إلى سطرها،
+    والسطر الذي لا يتسع يُتخطى لصالح الأسطر التالية. يعيد (النص، عدد الأسطر المختارة)."""
+    prefix = EVIDENCE_UNITS[unit]["prefix"]
+    noun = EVIDENCE_UNITS[unit]["noun"]
+    line_count = len(line_scores)
+    scores = line_scores.scores
+
+    def gap(count):
+        return f"... [تم حذف {count} {noun} منخفض الأهمية] ..."
+
+    # "<بادئة><رقم>: " + السطر مقتطعاً (مع علامة الاقتطاع) + فاصل السطر
+    number_digits = np.searchsorted(10 ** np.arange(1, 19, dtype=np.int64), np.arange(1, line_count + 1), side='right') + 1
+    chars = line_scores.chars(buffer)
+    costs = np.minimum(chars, EVIDENCE_LINE_CHARS) + 1 + len(prefix) + 2 + number_digits + 1
+    # كل نافذة مضافة قد تضيف علامة حذف واحدة على الأكثر، بالإضافة إلى علامة أخيرة
+    gap_cost = len(gap(line_count)) + 1
+    min_cost = int(costs.min()) + gap_cost if line_count else 0
+
+    selected = np.zeros(line_count, dtype=bool)
+    used = gap_cost
+    misses = 0
+    for line in np.argsort(-scores, kind='stable'):
+        if scores[line] <= 0 or misses >= EVIDENCE_MISSES_LIMIT or char_budget - used < min_cost:
+            break
+        if selected[line]:
+            continue
+        start = max(line - context, 0)
+        window = np.flatnonzero(~selected[start:line + context + 1]) + start
+        cost = int(costs[window].sum()) + gap_cost
+        if used + cost > char_budget:
+            # السياق لا يتسع: نكتفي بالسطر نفسه، وإن لم يتسع ننتقل إلى السطر التالي (قد يكون أقصر)
+            window = line
+            cost = int(costs[line]) + gap_cost
+            if used + cost > char_budget:
+                misses += 1
+                continue
+        selected[window] = True
+        used += cost
+        misses = 0
+
+    output = []
+    previous = -1
+    for line in np.flatnonzero(selected):
+        if line > previous + 1:
+            output.append(gap(line - previous - 1))
+        text = line_scores.text(buffer, line)
+        limit = min(int(chars[line]), EVIDENCE_LINE_CHARS)
+        if len(text) > limit:
+            text = text[:limit] + "…"
+        output.append(f"{prefix}{line + 1}: {text}")
+        previous = line
+    if previous < line_count - 1:
+        output.append(gap(line_count - previous - 1))
+    return "\n".join(output), int(selected.sum())
+
+
+def anomaly_ranking(buffer, line_scores, trimmed, selected_count, unit="line", limit=ANOMALY_TOP_LINES):
+    """ملخص الترتيب لإضافته إلى الاستجابة: الأسطر الأعلى درجة مع مكونات درجتها.
+
+    unit يوضح معنى الأرقام: "line" رقم السطر في الملف، و"event" ترتيب الحدث في الإسقاط المجمع."""
+    scores = line_scores.scores
+    top = np.argsort(-scores, kind='stable')[:limit]
+    return {
+        "unit": unit,
+        "total_lines": len(line_scores),
+        "trimmed": trimmed,
+        "selected_lines": selected_count,
+        "weights": ANOMALY_WEIGHTS,
+        "top_lines": [
+            {
+                "line": int(line) + 1,
+                "score": round(float(scores[line]), 4),
+                "components": {name: round(float(values[line]), 4) for name, values in line_scores.components.items()},
+                "text": line_scores.text(buffer, line)[:500]
+            }
+            for line in top if scores[line] > 0
+        ]
+    }
 
 
 @app.route('/')
@@ -230,6 +1505,10 @@ def index():
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>CyberThreat Analyzer v1.0.3</title>
     <script src="https://cdn.tailwindcss.com"></script>
+    <!-- مكتبة Vis.js للخط الزمني التفاعلي ومكونات العرض الافتراضي للجداول -->
+    <script type="text/javascript" src="https://unpkg.com/vis-timeline@7.7.3/standalone/umd/vis-timeline-graph2d.min.js"></script>
+    <link href="https://unpkg.com/vis-timeline@7.7.3/styles/vis-timeline-graph2d.min.css" rel="stylesheet" type="text/css" />
+    <script src="/static/js/result-views.js"></script>
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;700&display=swap');
         body {
@@ -360,54 +1639,25 @@ def index():
                     <!-- 2. استخبارات IP وحالة البنية -->
                     <div id="ipIntel" class="tab-content p-4">
                         <h4 class="text-xl font-bold mb-4 text-sky-300">استخبارات IP وحالة البنية</h4>
-                        <table class="min-w-full divide-y divide-gray-700">
-                            <thead class="bg-gray-700">
-                                <tr>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">عنوان IP</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">المنظمة</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">الدولة</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">الدور</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">الحالة</th>
-                                </tr>
-                            </thead>
-                            <tbody id="ipIntelBody" class="bg-gray-800 divide-y divide-gray-700">
-                                <!-- البيانات سيتم إدراجها هنا بواسطة JS -->
-                            </tbody>
-                        </table>
+                        <div id="ipIntelTable">
+                            <!-- الجدول الافتراضي سيتم بناؤه هنا بواسطة JS -->
+                        </div>
                     </div>
 
                     <!-- 3. تحليل السبب الجذري (RCA) -->
                     <div id="rca" class="tab-content p-4">
                         <h4 class="text-xl font-bold mb-4 text-sky-300">تحليل السبب الجذري (RCA)</h4>
-                        <table class="min-w-full divide-y divide-gray-700">
-                            <thead class="bg-gray-700">
-                                <tr>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">عنصر التحليل</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">النتيجة/التفاصيل</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">التوصية</th>
-                                </tr>
-                            </thead>
-                            <tbody id="rcaBody" class="bg-gray-800 divide-y divide-gray-700">
-                                <!-- البيانات سيتم إدراجها هنا بواسطة JS -->
-                            </tbody>
-                        </table>
+                        <div id="rcaTable">
+                            <!-- الجدول الافتراضي سيتم بناؤه هنا بواسطة JS -->
+                        </div>
                     </div>
 
                     <!-- 4. محاكاة YARA المطابقة -->
                     <div id="yara" class="tab-content p-4">
                         <h4 class="text-xl font-bold mb-4 text-sky-300">محاكاة YARA المطابقة</h4>
-                        <table class="min-w-full divide-y divide-gray-700">
-                            <thead class="bg-gray-700">
-                                <tr>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">القاعدة المطابقة</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">الشدة</th>
-                                    <th class="px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider">النتيجة</th>
-                                </tr>
-                            </thead>
-                            <tbody id="yaraBody" class="bg-gray-800 divide-y divide-gray-700">
-                                <!-- البيانات سيتم إدراجها هنا بواسطة JS -->
-                            </tbody>
-                        </table>
+                        <div id="yaraTable">
+                            <!-- الجدول الافتراضي سيتم بناؤه هنا بواسطة JS -->
+                        </div>
                     </div>
 
                     <!-- 5. التوصيات والإجراءات المضادة -->
@@ -418,13 +1668,12 @@ def index():
                         </ul>
                     </div>
                     
-                    <!-- 6. الخط الزمني التفاعلي (ملاحظة: هذا يتطلب مكتبة JS خارجية، سنعرض بيانات خام فقط) -->
+                    <!-- 6. الخط الزمني التفاعلي (Vis.js مع تجميع العناصر المتقاربة) -->
                     <div id="timeline" class="tab-content p-4">
-                        <h4 class="text-xl font-bold mb-4 text-sky-300">بيانات الخط الزمني (Groups & Items)</h4>
-                        <pre id="timelineData" class="bg-gray-900 p-4 rounded-lg text-sm overflow-auto text-green-300 h-64">
-                            ... البيانات الخام للخط الزمني سيتم عرضها هنا ...
-                            (ملاحظة: يتطلب هذا القسم مكتبة رسوم بيانية مثل Vis.js للعرض التفاعلي، ولكننا نعرض JSON الخام لضمان عمل الواجهة الأمامية.)
-                        </pre>
+                        <h4 class="text-xl font-bold mb-4 text-sky-300">الخط الزمني التفاعلي</h4>
+                        <div id="timelineVisualization" class="bg-gray-900 rounded-lg" style="min-height: 200px; width: 100%;">
+                            <!-- يتم إنشاء الخط الزمني عند فتح هذا التبويب لأول مرة -->
+                        </div>
                     </div>
 
                 </div>
@@ -471,6 +1720,9 @@ def index():
                     button.classList.add('active', 'bg-gray-700', 'text-white');
                     button.classList.remove('text-gray-400', 'hover:bg-gray-700', 'hover:text-white');
                     document.getElementById(targetTab).classList.add('active');
+
+                    // إنشاء الخط الزمني بشكل كسول عند أول عرض لتبويبه
+                    renderTimelineIfPending();
                 });
             });
 
@@ -492,60 +1744,41 @@ def index():
                 messageBox.classList.add('hidden');
             }
 
+            // فئات النتائج التفصيلية بالترتيب مع ألوانها
+            const FINDING_GROUPS = [
+                { key: 'critical', title: 'نتائج حرجة (Critical)', className: 'p-4 rounded-xl bg-red-700 text-red-100 shadow-lg' },
+                { key: 'high', title: 'نتائج عالية (High)', className: 'p-4 rounded-xl bg-orange-600 text-orange-100 shadow-lg' },
+                { key: 'medium', title: 'نتائج متوسطة (Medium)', className: 'p-4 rounded-xl bg-yellow-600 text-yellow-100 shadow-lg' },
+                { key: 'low', title: 'نتائج منخفضة (Low)', className: 'p-4 rounded-xl bg-green-600 text-green-100 shadow-lg' },
+            ];
+
             function renderDetailedFindings(findings) {
-                const container = document.getElementById('detailedFindings');
-                container.innerHTML = ''; // تنظيف المحتوى القديم
-
-                const categories = [
-                    { key: 'critical', title: 'نتائج حرجة (Critical)', color: 'bg-red-700', text: 'text-red-100' },
-                    { key: 'high', title: 'نتائج عالية (High)', color: 'bg-orange-600', text: 'text-orange-100' },
-                    { key: 'medium', title: 'نتائج متوسطة (Medium)', color: 'bg-yellow-600', text: 'text-yellow-100' },
-                    { key: 'low', title: 'نتائج منخفضة (Low)', color: 'bg-green-600', text: 'text-green-100' },
-                ];
-
-                categories.forEach(cat => {
-                    if (findings[cat.key] && findings[cat.key].length > 0) {
-                        const html = `
-                            <div class="p-4 rounded-xl ${cat.color} ${cat.text} shadow-lg">
-                                <h5 class="text-lg font-bold mb-3 border-b border-opacity-50 pb-2">${cat.title} (${findings[cat.key].length} نتيجة)</h5>
-                                <ul class="list-disc pr-6 space-y-3">
-                                    ${findings[cat.key].map(item => `
-                                        <li>
-                                            <p class="font-semibold">${item.النتيجة}</p>
-                                            <p class="text-sm opacity-90 mt-1"><strong>التوصية:</strong> ${item.التوصية}</p>
-                                        </li>
-                                    `).join('')}
-                                </ul>
-                            </div>
-                        `;
-                        container.insertAdjacentHTML('beforeend', html);
-                    }
-                });
+                // كل فئة تُعرض كجدول افتراضي؛ النصوص تُسند عبر textContent
+                ResultViews.renderFindings(document.getElementById('detailedFindings'), findings, FINDING_GROUPS.map(group => Object.assign({
+                    titleClassName: 'text-lg font-bold mb-3 border-b border-opacity-50 pb-2'
+                }, group)));
             }
 
-            function renderTable(data, tableId) {
-                const tbody = document.getElementById(tableId);
-                tbody.innerHTML = '';
-                
-                if (data.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="5" class="px-6 py-4 text-center text-gray-500">لا توجد بيانات متاحة في هذا القسم.</td></tr>';
+            // أعمدة الجداول بالترتيب كما في مخطط التحليل (ANALYSIS_SCHEMA)
+            const TABLE_COLUMNS = {{ table_columns|tojson }};
+            let pendingTimelineData = null; // يُرسم الخط الزمني عند فتح تبويبه فقط
+            let timeline = null;
+
+            function renderTable(table, tableName, containerId) {
+                const columns = (table && table.columns) || TABLE_COLUMNS[tableName];
+                const rows = ResultViews.tableRows(table, columns);
+                new ResultViews.VirtualTable(document.getElementById(containerId), columns, rows);
+            }
+
+            function renderTimelineIfPending() {
+                if (pendingTimelineData === null || !document.getElementById('timeline').classList.contains('active')) {
                     return;
                 }
-
-                data.forEach(row => {
-                    // افتراض أن جميع الصفوف لها نفس عدد المفاتيح
-                    const keys = Object.keys(data[0] || {}); 
-                    
-                    const rowHtml = keys.map(key => 
-                        `<td class="px-6 py-4 whitespace-nowrap text-sm text-gray-300">${row[key]}</td>`
-                    ).join('');
-                    
-                    tbody.insertAdjacentHTML('beforeend', `
-                        <tr class="hover:bg-gray-700 transition duration-150">
-                            ${rowHtml}
-                        </tr>
-                    `);
-                });
+                if (timeline) {
+                    timeline.destroy();
+                }
+                timeline = ResultViews.createClusteredTimeline(document.getElementById('timelineVisualization'), pendingTimelineData);
+                pendingTimelineData = null;
             }
 
             // ==========================================================
@@ -575,16 +1808,21 @@ def index():
                 renderDetailedFindings(data.detailed_findings);
 
                 // 4. الجداول (Tables)
-                renderTable(data.tables.ip_intelligence, 'ipIntelBody');
-                renderTable(data.tables.rca_analysis, 'rcaBody');
-                renderTable(data.tables.yara_analysis, 'yaraBody');
+                renderTable(data.tables.ip_intelligence, 'ip_intelligence', 'ipIntelTable');
+                renderTable(data.tables.rca_analysis, 'rca_analysis', 'rcaTable');
+                renderTable(data.tables.yara_analysis, 'yara_analysis', 'yaraTable');
 
                 // 5. التوصيات
                 const recList = document.getElementById('recommendationsList');
-                recList.innerHTML = data.recommendations.map(rec => `<li>${rec}</li>`).join('');
+                recList.replaceChildren(...(data.recommendations || []).map(rec => {
+                    const li = document.createElement('li');
+                    li.textContent = rec;
+                    return li;
+                }));
 
-                // 6. الخط الزمني (Raw Data)
-                document.getElementById('timelineData').textContent = JSON.stringify(data.interactive_timeline, null, 2);
+                // 6. الخط الزمني (يُرسم عند فتح التبويب)
+                pendingTimelineData = data.interactive_timeline || {};
+                renderTimelineIfPending();
 
                 // 7. البيانات الوصفية (Metadata)
                 document.getElementById('analysisTime').textContent = data.analysis_metadata.analysis_time;
@@ -612,7 +1850,8 @@ def index():
                     const formData = new FormData();
                     formData.append('file', logFile);
                     
-                    const response = await fetch('/analyze', {
+                    // الصيغة المضغوطة ترسل صفوف الجداول كمصفوفات بدلاً من تكرار أسماء المفاتيح
+                    const response = await fetch('/analyze?format=compact', {
                         method: 'POST',
                         body: formData
                     });
@@ -646,7 +1885,13 @@ def index():
 </body>
 </html>
 """
-    return render_template_string(html_content)
+    return render_template_string(html_content, table_columns=TABLE_COLUMNS)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """رفض الملفات التي تتجاوز الحد الأقصى قبل قراءتها بالكامل."""
+    max_mb = MAX_UPLOAD_BYTES // (1024 * 1024)
+    return jsonify({"success": False, "error": f"حجم الملف يتجاوز الحد الأقصى المسموح به ({max_mb} ميجابايت)."}), 413
 
 @app.route('/analyze', methods=['POST'])
 def analyze_log():
@@ -663,10 +1908,73 @@ def analyze_log():
     if log_file.filename == '':
         return jsonify({"success": False, "error": "لم يتم اختيار ملف"}), 400
 
-    if log_file and log_file.filename.endswith(('.log', '.txt', '.csv', '.json', '.jsonl')):
+    if log_file and log_file.filename.lower().endswith(('.log', '.txt') + STRUCTURED_EXTENSIONS):
         try:
-            # قراءة محتويات الملف مباشرة من الذاكرة
-            log_content = log_file.read().decode('utf-8')
+            filename = log_file.filename.lower()
+            log_description = "إليك محتوى ملف السجل للتحليل الجنائي. قم بتنفيذ التحليل بناءً على المخطط المطلوب. ملف السجل هو:\n\n---\n\n"
+
+            log_header = ""
+
+            # قراءة محتويات الملف عبر mmap؛ الترتيب يتم على المخزن مباشرة ولا يُفك ترميز إلا ما سيُرسل
+            with open_log_buffer(log_file) as log_buffer:
+                evidence = log_buffer
+                unit = "line"
+                if filename.endswith(STRUCTURED_EXTENSIONS):
+                    # السجلات المنظمة تُرسل كإسقاط عمودي مضغوط بدلاً من النص الخام
+                    try:
+                        table = parse_structured_log(log_buffer, filename)
+                        if table.row_count:
+                            log_header, events, groups = table.project()
+                            log_header += "\n"
+                            evidence = "\n".join(events).encode('utf-8')
+                            unit = "event"
+                            del events
+                            log_description = (
+                                "إليك إسقاطاً عمودياً مضغوطاً لملف سجل منظم للتحليل الجنائي: "
+                                "تم اختيار الأعمدة الأمنية، واستبعاد الأعمدة عالية التباين، وترميز الأعمدة المتكررة بقواميس، "
+                                "وتجميع الأحداث المتطابقة مع عدد تكرارها. قم بتنفيذ التحليل بناءً على المخطط المطلوب:\n\n---\n\n"
+                            )
+                    except (ValueError, csv.Error) as e:
+                        # ملف غير صالح كبنية منظمة: نرسله كنص خام
+                        print(f"Structured parsing failed, falling back to raw text: {e}")
+
+                # ملخص الأعمدة لا يتجاوز ثلاثة أرباع الميزانية حتى يبقى مكان للأحداث نفسها
+                # يُقتطع من الإحصاءات والقواميس، أما سطر وصف أعمدة الأحداث المجمعة (آخر سطر) فيبقى دائماً
+                header_limit = PROMPT_CHAR_BUDGET * 3 // 4
+                if len(log_header) > header_limit:
+                    body, legend = log_header.rstrip("\n").rsplit("\n", 1)
+                    note = "\n... [تم اقتطاع ملخص الأعمدة لتجاوزه الحد المسموح] ...\n\n"
+                    log_header = body[:max(header_limit - len(legend) - len(note) - 1, 0)] + note + legend + "\n"
+
+                # ترتيب الأسطر (أو الأحداث المجمعة) حسب الشذوذ؛ عند تجاوز الميزانية تُرسل الأسطر الأعلى درجة مع سياقها فقط.
+                # الأحداث المجمعة تُرتب من رموز الجدول وعدد تكرارها لا من نصها المُرمَّز
+                if unit == "event":
+                    line_scores = score_events(table, groups, evidence)
+                    del table, groups
+                else:
+                    line_scores = score_log_lines(evidence)
+                evidence_budget = max(PROMPT_CHAR_BUDGET - len(log_header), 0)
+                trimmed = not line_scores.fits(evidence, evidence_budget)
+                if trimmed:
+                    log_content, selected_count = select_evidence(evidence, line_scores, evidence_budget, unit)
+                    if unit == "event":
+                        trim_note = (
+                            f"ملاحظة: قائمة الأحداث المجمعة أكبر من الحد المسموح، لذلك تم اختيار {selected_count} حدثاً من أصل {len(line_scores)} "
+                            "بعد ترتيبها إحصائياً حسب الشذوذ مع الأحداث المجاورة لها. كل حدث مسبوق بترتيبه في قائمة الأحداث المجمعة (E<رقم>)، "
+                            "وهو ليس رقم سطر في الملف الأصلي.\n\n"
+                        )
+                    else:
+                        trim_note = (
+                            f"ملاحظة: السجل أكبر من الحد المسموح، لذلك تم اختيار {selected_count} سطراً من أصل {len(line_scores)} "
+                            "بعد ترتيبها إحصائياً حسب الشذوذ (ندرة القالب وعنوان IP، الاندفاعات الزمنية، أزواج المستخدم/المضيف الجديدة، الأخطاء) "
+                            "مع أسطر السياق المحيطة بها. كل سطر مسبوق برقمه الأصلي في الملف (L<رقم>).\n\n"
+                        )
+                    log_description = trim_note + log_description
+                else:
+                    log_content = str(evidence, 'utf-8')
+                    selected_count = len(line_scores)
+                ranking = anomaly_ranking(evidence, line_scores, trimmed, selected_count, unit)
+                del evidence, line_scores
             
             # بناء موجه النظام
             system_instruction = (
@@ -677,8 +1985,8 @@ def analyze_log():
                 "كن دقيقًا وموجزًا في التحليل والنتائج."
             )
             
-            # بناء موجه المستخدم
-            user_prompt = f"إليك محتوى ملف السجل للتحليل الجنائي. قم بتنفيذ التحليل بناءً على المخطط المطلوب. ملف السجل هو:\n\n---\n\n{log_content}"
+            # بناء موجه المستخدم كأجزاء منفصلة لتجنب نسخة ثالثة كاملة من السجل داخل نص واحد
+            user_prompt = [log_description, log_header, log_content] if log_header else [log_description, log_content]
             
             # استدعاء Gemini API
             response = client.models.generate_content(
@@ -704,6 +2012,12 @@ def analyze_log():
                     raise json.JSONDecodeError("Response is not valid JSON.", doc=json_text, pos=0)
 
                 analysis_data = json.loads(json_text)
+                if isinstance(analysis_data, dict):
+                    analysis_data["anomaly_ranking"] = ranking
+
+                    # الصيغة المضغوطة (?format=compact) للنتائج الكبيرة
+                    if request.args.get('format') == 'compact':
+                        analysis_data = compact_tables(analysis_data)
                 return jsonify(analysis_data)
             
             except json.JSONDecodeError as e:
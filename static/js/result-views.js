@@ -0,0 +1,478 @@
+// ==========================================================
+// مكونات عرض النتائج الكبيرة (جداول افتراضية وخط زمني مجمّع)
+// ==========================================================
+
+(function (window) {
+    'use strict';
+
+    const OVERSCAN_ROWS = 8; // صفوف إضافية أعلى وأسفل النافذة المرئية لتجنب الوميض أثناء التمرير
+    const FILTER_DELAY_MS = 150;
+    const collator = new Intl.Collator('ar', { numeric: true, sensitivity: 'base' });
+
+    const DEFAULT_CLASSES = {
+        table: 'min-w-full divide-y divide-gray-700',
+        thead: 'bg-gray-700',
+        th: 'px-6 py-3 text-right text-xs font-medium text-gray-300 uppercase tracking-wider cursor-pointer select-none',
+        tbody: 'bg-gray-800 divide-y divide-gray-700',
+        tr: 'hover:bg-gray-700 transition duration-150',
+        td: 'px-6 text-sm text-gray-300',
+        input: 'w-full md:w-72 bg-gray-900 border border-gray-700 rounded-lg px-3 py-2 text-sm text-gray-200',
+        empty: 'px-6 py-4 text-center text-gray-500'
+    };
+
+    /**
+     * تحويل جدول إلى صفوف من المصفوفات بترتيب الأعمدة المحدد.
+     * يقبل الصيغة المضغوطة ({columns, rows}) أو مصفوفة كائنات بمفاتيح عربية.
+     * @param {Object|Array<Object>} table - بيانات الجدول من الاستجابة.
+     * @param {Array<string>} columns - أسماء الأعمدة بالترتيب.
+     * @returns {Array<Array>} - صفوف الجدول.
+     */
+    function tableRows(table, columns) {
+        if (!table) {
+            return [];
+        }
+        if (Array.isArray(table.rows)) {
+            return table.rows;
+        }
+        return table.map(row => columns.map(column => row[column] ?? ''));
+    }
+
+    /**
+     * جدول افتراضي (Windowed): يرسم الصفوف المرئية فقط مع فرز وتصفية من جهة العميل.
+     */
+    class VirtualTable {
+        /**
+         * @param {HTMLElement} container - الحاوية التي سيُبنى فيها الجدول.
+         * @param {Array<string>} columns - رؤوس الأعمدة بالترتيب.
+         * @param {Array<Array>} rows - صفوف البيانات كمصفوفات.
+         * @param {Object} options - rowHeight، height، classes، renderCell ({اسم العمود: (القيمة، الخلية) => void}).
+         *
+         * الصفوف بارتفاع ثابت ونصوصها مقتطعة؛ النقر على صف يوسّعه لعرض النص كاملاً بأسطر ملتفة،
+         * وتُقاس ارتفاعات الصفوف الموسعة فقط لتبقى حسابات النافذة المرئية سريعة.
+         */
+        constructor(container, columns, rows, options = {}) {
+            this.container = container;
+            this.columns = columns;
+            this.rows = rows;
+            this.rowHeight = options.rowHeight || 44;
+            this.height = options.height || 420;
+            this.classes = Object.assign({}, DEFAULT_CLASSES, options.classes || {});
+            this.renderCell = options.renderCell || {};
+
+            this.view = rows.map((_, index) => index); // فهارس الصفوف بعد التصفية والفرز
+            this.searchKeys = null; // تُحسب عند أول تصفية فقط
+            this.filterText = '';
+            this.sortColumn = -1;
+            this.sortDirection = 1;
+            this.frame = null;
+            this.filterTimer = null;
+            this.expanded = new Map(); // فهرس الصف -> الارتفاع الإضافي المقاس للصف الموسع
+            this.expandedPositions = []; // [موضع الصف في العرض، مجموع الارتفاع الإضافي حتى هذا الصف] مرتبة
+
+            this._build();
+            this._render();
+        }
+
+        _build() {
+            this.container.innerHTML = '';
+
+            const toolbar = document.createElement('div');
+            toolbar.className = 'flex items-center justify-between gap-4 mb-3';
+            this.filterInput = document.createElement('input');
+            this.filterInput.type = 'search';
+            this.filterInput.placeholder = 'تصفية الصفوف...';
+            this.filterInput.className = this.classes.input;
+            this.filterInput.addEventListener('input', () => {
+                clearTimeout(this.filterTimer);
+                this.filterTimer = setTimeout(() => this.setFilter(this.filterInput.value), FILTER_DELAY_MS);
+            });
+            this.countLabel = document.createElement('span');
+            this.countLabel.className = 'text-xs text-gray-500 whitespace-nowrap';
+            this.countLabel.title = 'انقر على أي صف لعرض نصه كاملاً';
+            toolbar.append(this.filterInput, this.countLabel);
+
+            this.viewport = document.createElement('div');
+            this.viewport.className = 'overflow-auto rounded-lg';
+            this.viewport.style.maxHeight = `${this.height}px`;
+            this.viewport.addEventListener('scroll', () => this._scheduleRender(), { passive: true });
+
+            const table = document.createElement('table');
+            table.className = this.classes.table;
+            const thead = document.createElement('thead');
+            thead.className = this.classes.thead;
+            const headRow = document.createElement('tr');
+            this.headerCells = this.columns.map((column, index) => {
+                const th = document.createElement('th');
+                th.className = `${this.classes.th} ${this.classes.thead}`;
+                th.style.position = 'sticky';
+                th.style.top = '0';
+                th.style.zIndex = '1';
+                th.textContent = column;
+                th.addEventListener('click', () => this.sortBy(index));
+                headRow.appendChild(th);
+                return th;
+            });
+            thead.appendChild(headRow);
+            this.tbody = document.createElement('tbody');
+            this.tbody.className = this.classes.tbody;
+            this.tbody.addEventListener('click', event => {
+                const tr = event.target.closest('tr[data-row]');
+                if (tr) {
+                    this.toggleRow(Number(tr.dataset.row));
+                }
+            });
+            table.append(thead, this.tbody);
+            this.viewport.appendChild(table);
+
+            this.container.append(toolbar, this.viewport);
+        }
+
+        /**
+         * تصفية الصفوف بنص يطابق أي عمود (غير حساس لحالة الأحرف).
+         * @param {string} text - نص التصفية.
+         */
+        setFilter(text) {
+            this.filterText = text.trim().toLowerCase();
+            if (this.filterText && !this.searchKeys) {
+                this.searchKeys = this.rows.map(row => row.join('\u0001').toLowerCase());
+            }
+            this._applyView();
+        }
+
+        /**
+         * الفرز حسب عمود؛ النقر مرة أخرى على نفس العمود يعكس الاتجاه.
+         * @param {number} columnIndex - فهرس العمود.
+         */
+        sortBy(columnIndex) {
+            if (this.sortColumn === columnIndex) {
+                this.sortDirection = -this.sortDirection;
+            } else {
+                this.sortColumn = columnIndex;
+                this.sortDirection = 1;
+            }
+            this.headerCells.forEach((th, index) => {
+                const arrow = index !== columnIndex ? '' : (this.sortDirection === 1 ? ' ▲' : ' ▼');
+                th.textContent = this.columns[index] + arrow;
+            });
+            this._applyView();
+        }
+
+        /**
+         * توسيع صف لعرض نصوصه كاملة أو إعادته إلى الارتفاع الثابت.
+         * @param {number} rowIndex - فهرس الصف في البيانات الأصلية.
+         */
+        toggleRow(rowIndex) {
+            if (this.expanded.has(rowIndex)) {
+                this.expanded.delete(rowIndex);
+            } else {
+                this.expanded.set(rowIndex, 0); // يُقاس الارتفاع بعد الرسم
+            }
+            this._indexExpanded();
+            this._render();
+        }
+
+        _indexExpanded() {
+            // يُحسب عند تغيير العرض أو التوسيع فقط، وليس عند كل تمرير
+            this.expandedPositions = [];
+            if (this.expanded.size === 0) {
+                return;
+            }
+            let extra = 0;
+            this.view.forEach((rowIndex, position) => {
+                if (this.expanded.has(rowIndex)) {
+                    extra += this.expanded.get(rowIndex);
+                    this.expandedPositions.push([position, extra]);
+                }
+            });
+        }
+
+        _extraBefore(position) {
+            // مجموع الارتفاعات الإضافية للصفوف الموسعة الواقعة قبل الموضع (بحث ثنائي)
+            const entries = this.expandedPositions;
+            let low = 0;
+            let high = entries.length;
+            while (low < high) {
+                const middle = (low + high) >> 1;
+                if (entries[middle][0] < position) {
+                    low = middle + 1;
+                } else {
+                    high = middle;
+                }
+            }
+            return low === 0 ? 0 : entries[low - 1][1];
+        }
+
+        _offsetOf(position) {
+            return position * this.rowHeight + this._extraBefore(position);
+        }
+
+        _positionAt(offset) {
+            // أكبر موضع يبدأ عند الإزاحة المعطاة أو قبلها
+            let low = 0;
+            let high = this.view.length;
+            while (low < high) {
+                const middle = (low + high + 1) >> 1;
+                if (this._offsetOf(middle) <= offset) {
+                    low = middle;
+                } else {
+                    high = middle - 1;
+                }
+            }
+            return low;
+        }
+
+        _applyView() {
+            let view = this.rows.map((_, index) => index);
+            if (this.filterText) {
+                view = view.filter(index => this.searchKeys[index].includes(this.filterText));
+            }
+            if (this.sortColumn >= 0) {
+                const column = this.sortColumn;
+                const direction = this.sortDirection;
+                view.sort((a, b) => direction * collator.compare(String(this.rows[a][column]), String(this.rows[b][column])));
+            }
+            this.view = view;
+            this._indexExpanded();
+            this.viewport.scrollTop = 0;
+            this._render();
+        }
+
+        _scheduleRender() {
+            if (this.frame === null) {
+                this.frame = requestAnimationFrame(() => {
+                    this.frame = null;
+                    this._render();
+                });
+            }
+        }
+
+        _spacerRow(height) {
+            const tr = document.createElement('tr');
+            tr.style.height = `${height}px`;
+            const td = document.createElement('td');
+            td.colSpan = this.columns.length;
+            td.style.padding = '0';
+            tr.appendChild(td);
+            return tr;
+        }
+
+        _render() {
+            const total = this.view.length;
+            this.countLabel.textContent = `${total.toLocaleString('ar')} / ${this.rows.length.toLocaleString('ar')} صف`;
+
+            if (total === 0) {
+                const tr = document.createElement('tr');
+                const td = document.createElement('td');
+                td.colSpan = this.columns.length;
+                td.className = this.classes.empty;
+                td.textContent = this.rows.length === 0 ? 'لا توجد بيانات متاحة في هذا القسم.' : 'لا توجد صفوف مطابقة للتصفية.';
+                tr.appendChild(td);
+                this.tbody.replaceChildren(tr);
+                return;
+            }
+
+            // حساب النافذة المرئية فقط من موضع التمرير
+            const viewportHeight = this.viewport.clientHeight || this.height;
+            const scrollTop = this.viewport.scrollTop;
+            const start = Math.max(0, this._positionAt(scrollTop) - OVERSCAN_ROWS);
+            const end = Math.min(total, this._positionAt(scrollTop + viewportHeight) + 1 + OVERSCAN_ROWS);
+
+            const fragment = document.createDocumentFragment();
+            const startOffset = this._offsetOf(start);
+            if (startOffset > 0) {
+                fragment.appendChild(this._spacerRow(startOffset));
+            }
+            const expandedRows = [];
+            for (let position = start; position < end; position++) {
+                const rowIndex = this.view[position];
+                const row = this.rows[rowIndex];
+                const isExpanded = this.expanded.has(rowIndex);
+                const tr = document.createElement('tr');
+                tr.className = `${this.classes.tr} cursor-pointer`;
+                tr.dataset.row = rowIndex;
+                if (isExpanded) {
+                    expandedRows.push(tr);
+                } else {
+                    tr.style.height = `${this.rowHeight}px`;
+                }
+                this.columns.forEach((column, index) => {
+                    const td = document.createElement('td');
+                    td.className = this.classes.td;
+                    const value = row[index] ?? '';
+                    const cell = document.createElement('div');
+                    if (isExpanded) {
+                        // الصف الموسع يعرض النص كاملاً بأسطر ملتفة
+                        cell.className = 'whitespace-normal break-words py-3';
+                        cell.style.maxWidth = '36rem';
+                    } else {
+                        cell.className = 'truncate';
+                        cell.style.maxWidth = '28rem';
+                        cell.title = value;
+                    }
+                    if (this.renderCell[column]) {
+                        this.renderCell[column](value, cell);
+                    } else {
+                        cell.textContent = value;
+                    }
+                    td.appendChild(cell);
+                    tr.appendChild(td);
+                });
+                fragment.appendChild(tr);
+            }
+            const endOffset = this._offsetOf(total) - this._offsetOf(end);
+            if (endOffset > 0) {
+                fragment.appendChild(this._spacerRow(endOffset));
+            }
+            this.tbody.replaceChildren(fragment);
+
+            // قياس الصفوف الموسعة المرئية وتحديث الإزاحات إذا تغير ارتفاعها
+            let changed = false;
+            expandedRows.forEach(tr => {
+                const rowIndex = Number(tr.dataset.row);
+                const extra = Math.max(0, tr.offsetHeight - this.rowHeight);
+                if (tr.offsetHeight && extra !== this.expanded.get(rowIndex)) {
+                    this.expanded.set(rowIndex, extra);
+                    changed = true;
+                }
+            });
+            if (changed) {
+                this._indexExpanded();
+                this._scheduleRender();
+            }
+        }
+    }
+
+    const FINDING_COLUMNS = ['النتيجة', 'التوصية'];
+
+    /**
+     * عرض النتائج التفصيلية مجمعة حسب الخطورة: عنوان لكل فئة وجدول افتراضي لعناصرها.
+     * تُبنى العناصر كعُقد DOM وتُسند النصوص عبر textContent فقط (دون سلاسل HTML).
+     * @param {HTMLElement} container - حاوية النتائج.
+     * @param {Object} findings - كائن {critical: [{النتيجة، التوصية}], high: [...], ...}.
+     * @param {Array<Object>} groups - الفئات بالترتيب: {key، title، className، titleClassName، icon، borderColor}.
+     * @param {Object} options - classes (تنسيق الجداول) و emptyText (نص عند عدم وجود نتائج).
+     * @returns {number} - عدد النتائج المعروضة.
+     */
+    function renderFindings(container, findings, groups, options = {}) {
+        container.replaceChildren();
+        let total = 0;
+        groups.forEach(group => {
+            const items = findings && Array.isArray(findings[group.key]) ? findings[group.key] : [];
+            if (items.length === 0) {
+                return;
+            }
+            total += items.length;
+
+            const section = document.createElement('div');
+            section.className = group.className || '';
+            if (group.borderColor) {
+                section.style.borderColor = group.borderColor;
+            }
+            const title = document.createElement('h5');
+            title.className = group.titleClassName || 'text-lg font-bold mb-3';
+            if (group.icon) {
+                const icon = document.createElement('i');
+                icon.className = `${group.icon} ml-2`;
+                title.appendChild(icon);
+            }
+            title.append(`${group.title} (${items.length})`);
+            const body = document.createElement('div');
+            section.append(title, body);
+            container.appendChild(section);
+
+            const rows = items.map(item => FINDING_COLUMNS.map(column => (item && item[column]) ?? ''));
+            new VirtualTable(body, FINDING_COLUMNS, rows, { classes: options.classes, height: options.height });
+        });
+
+        if (total === 0 && options.emptyText) {
+            const empty = document.createElement('p');
+            empty.className = 'text-gray-500';
+            empty.textContent = options.emptyText;
+            container.appendChild(empty);
+        }
+        return total;
+    }
+
+    /**
+     * إنشاء خط زمني Vis.js مع تجميع (Clustering) العناصر المتقاربة.
+     * Vis.js يرسم العناصر الواقعة داخل النافذة الزمنية المرئية فقط، والتجميع يمنع رسم آلاف العناصر المتراكمة.
+     * @param {HTMLElement} container - حاوية الخط الزمني.
+     * @param {Object} timelineData - كائن {groups, items} من الاستجابة.
+     * @param {Object} settings - itemStyle (نمط العناصر الافتراضي) و options (خيارات Vis.js إضافية مثل template).
+     * @returns {vis.Timeline|null} - نسخة الخط الزمني أو null إذا لم تتوفر بيانات أو فشل الإنشاء.
+     */
+    function createClusteredTimeline(container, timelineData, settings = {}) {
+        container.innerHTML = '';
+        if (!timelineData || !Array.isArray(timelineData.items) || timelineData.items.length === 0) {
+            container.innerHTML = '<p class="text-gray-500 p-4">لا تتوفر بيانات خط زمني تفاعلي في هذا التحليل.</p>';
+            return null;
+        }
+
+        try {
+            // المعرفات يولدها النموذج وقد تتكرر: المعرف المكرر يُحذف ليُسند DataSet معرفاً جديداً
+            const seenIds = new Set();
+            let minTime = Infinity;
+            let maxTime = -Infinity;
+            const items = timelineData.items.map(item => {
+                // حساب النطاق الزمني في مرور واحد بدلاً من استعلامات DataSet
+                const time = Date.parse(item.start);
+                if (!Number.isNaN(time)) {
+                    minTime = Math.min(minTime, time);
+                    maxTime = Math.max(maxTime, time);
+                }
+                const entry = {
+                    content: String(item.content ?? ''),
+                    title: String(item.content ?? ''),
+                    start: item.start,
+                    group: item.group,
+                    type: item.type || 'point',
+                    style: item.style || settings.itemStyle
+                };
+                if (item.id !== undefined && item.id !== null && !seenIds.has(item.id)) {
+                    seenIds.add(item.id);
+                    entry.id = item.id;
+                }
+                return entry;
+            });
+            if (!Number.isFinite(minTime)) {
+                minTime = maxTime = Date.now();
+            }
+
+            const seenGroups = new Set();
+            const groupList = (Array.isArray(timelineData.groups) ? timelineData.groups : [])
+                .filter(group => group && !seenGroups.has(group.id) && seenGroups.add(group.id))
+                .map(group => ({ id: group.id, content: String(group.content ?? '') }));
+            const groups = groupList.length > 0 ? new vis.DataSet(groupList) : null;
+
+            const options = Object.assign({
+                orientation: 'top',
+                editable: false,
+                stack: true,
+                verticalScroll: true,
+                maxHeight: 420,
+                zoomMax: 315360000000, // 10 سنوات بالمللي ثانية
+                zoomMin: 1000, // ثانية واحدة
+                start: minTime - 3600000,
+                end: maxTime + 3600000,
+                cluster: {
+                    maxItems: 5,
+                    showStipes: true,
+                    fitOnDoubleClick: true,
+                    titleTemplate: '{count} حدث مجمّع — انقر نقراً مزدوجاً للتكبير'
+                }
+            }, settings.options || {});
+
+            const dataset = new vis.DataSet(items);
+            return groups
+                ? new vis.Timeline(container, dataset, groups, options)
+                : new vis.Timeline(container, dataset, options);
+        } catch (error) {
+            // فشل الخط الزمني لا يجب أن يوقف عرض بقية النتائج
+            console.error('Timeline Error:', error);
+            container.innerHTML = '<p class="text-gray-500 p-4">تعذر عرض الخط الزمني التفاعلي لهذا التحليل.</p>';
+            return null;
+        }
+    }
+
+    window.ResultViews = { VirtualTable, tableRows, renderFindings, createClusteredTimeline };
+})(window);